@@ -1,106 +1,875 @@
 import os
+import io
+import abc
+import sys
+import csv
+import codecs
+import contextvars
+import logging
+import argparse
+import asyncio
 import time
 import re
 import json
+import html as html_lib
+import queue
+import random
+import hashlib
+import importlib.util
+import sqlite3
+import mmap
+import threading
+import unicodedata
+import weakref
+import zlib
 import requests
-import pandas as pd
 import streamlit as st
 import openai
 
+from array import array
 from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
-from langdetect import detect
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
+from itertools import chain
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, urljoin, urldefrag
+from xml.etree import ElementTree
+from langdetect import DetectorFactory, detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Optional dependencies (see requirements.txt). These two have fallbacks;
+# lxml, selectolax, sentence-transformers and pyarrow are only imported by
+# the parser backend, keyword matcher or output format that needs them.
+try:
+    import numpy as np
+except ImportError:  # only needed by the local keyword matcher
+    np = None
+try:
+    import brotli  # urllib3 decodes "br" when it is installed
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    brotli = None
+    ACCEPT_ENCODING = "gzip, deflate"
+
+# Progress and fetch problems are logged here, never written straight to the
+# page, so the analysis core also runs headless (CLI, cron, worker processes).
+# The Streamlit app attaches a StreamlitLogHandler to show them in the UI.
+logger = logging.getLogger("content_agent")
+# The analysis job (if any) the current thread works for: set in a job's
+# thread and, through worker_init, in its crawler and LLM workers, so each
+# job's log panel only shows its own records.
+_log_job: contextvars.ContextVar[str | None] = contextvars.ContextVar("log_job", default=None)
 
 # -----------------------------------------------------------------------------
-# SECTION 1: HELPER FUNCTIONS (UNCHANGED from your original script)
+# SECTION 1: FETCHING, PARSING AND INSTRUMENTATION
 # -----------------------------------------------------------------------------
 
-def extract_main_content(url: str, max_retries: int = 3, backoff_factor: int = 2) -> BeautifulSoup | None:
+USER_AGENT = "Mozilla/5.0 (compatible; SEO-Analyzer/1.0; +https://example.com/bot)"
+
+# Set to a file path to keep ETag/Last-Modified validators (and the bodies they
+# validate) between runs, so weekly re-audits get 304s for unchanged pages.
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH")
+
+
+# Per-stage instrumentation. Timers wrap fetch (throttle, http, backoff),
+# parse, index, language ID, each rule, each LLM call and tip generation;
+# they feed histograms, counters and a per-URL breakdown. Disabled (the
+# default), timed() returns a shared no-op context, so the hooks cost a
+# function call.
+AUDIT_METRICS = os.getenv("AUDIT_METRICS", "") not in ("", "0", "false")
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class _StageTimer:
+    def __init__(self, instruments, stage: str, name: str):
+        self.instruments = instruments
+        self.stage = stage
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instruments.observe(self.stage, time.perf_counter() - self.started, self.name)
+        return False
+
+
+class Instruments:
+    def __init__(self, enabled: bool = AUDIT_METRICS, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # HostSchedulers whose per-host stats() are reported alongside
+        self._host_sources = weakref.WeakSet()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            # (stage, name) -> {"buckets": per-bucket counts (+Inf last), "count", "sum", "max"}
+            self._stages: dict[tuple[str, str], dict[str, any]] = {}
+            self._counters: dict[str, float] = {}
+            self._pages: dict[str, dict[str, float]] = {}
+
+    def timed(self, stage: str, name: str = ""):
+        if not self.enabled:
+            return _NO_TIMER
+        return _StageTimer(self, stage, name)
+
+    def page(self, url: str):
+        # attributes observations made by this thread to url until exit
+        if not self.enabled:
+            return _NO_TIMER
+        return _PageScope(self._local, url)
+
+    def observe(self, stage: str, seconds: float, name: str = "", url: str | None = None) -> None:
+        if not self.enabled:
+            return
+        url = url or getattr(self._local, "url", None)
+        slot = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            hist = self._stages.get((stage, name))
+            if hist is None:
+                hist = self._stages[(stage, name)] = {
+                    "buckets": [0] * (len(self.buckets) + 1), "count": 0, "sum": 0.0, "max": 0.0,
+                }
+            hist["buckets"][slot] += 1
+            hist["count"] += 1
+            hist["sum"] += seconds
+            hist["max"] = max(hist["max"], seconds)
+            if url:
+                page = self._pages.setdefault(url, {})
+                page[stage] = page.get(stage, 0.0) + seconds
+
+    def count(self, event: str, n: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + n
+
+    def watch_hosts(self, source) -> None:
+        with self._lock:
+            self._host_sources.add(source)
+
+    def host_stats(self) -> dict[str, dict[str, float]]:
+        # per-host request, throttle and backoff totals across every watched
+        # scheduler (normally just the run's one)
+        with self._lock:
+            sources = list(self._host_sources)
+        hosts: dict[str, dict[str, float]] = {}
+        for source in sources:
+            for host, stats in source.stats().items():
+                total = hosts.setdefault(host, dict.fromkeys(stats, 0))
+                for key, value in stats.items():
+                    total[key] = round(total[key] + value, 3)
+        return dict(sorted(hosts.items()))
+
+    def pop_page(self, url: str) -> dict[str, float]:
+        # seconds per stage spent on url so far, forgotten afterwards
+        with self._lock:
+            page = self._pages.pop(url, {})
+        return {stage: round(seconds, 4) for stage, seconds in page.items()}
+
+    def snapshot(self, reset: bool = False) -> dict[str, any]:
+        # picklable state, merged back with merge() (used by worker processes)
+        with self._lock:
+            snap = {
+                "stages": {key: dict(hist, buckets=list(hist["buckets"])) for key, hist in self._stages.items()},
+                "counters": dict(self._counters),
+                "pages": {url: dict(page) for url, page in self._pages.items()},
+            }
+            if reset:
+                self._stages, self._counters, self._pages = {}, {}, {}
+        return snap
+
+    def merge(self, snap: dict[str, any]) -> None:
+        with self._lock:
+            for key, other in snap["stages"].items():
+                hist = self._stages.get(key)
+                if hist is None:
+                    self._stages[key] = dict(other, buckets=list(other["buckets"]))
+                    continue
+                hist["buckets"] = [a + b for a, b in zip(hist["buckets"], other["buckets"])]
+                hist["count"] += other["count"]
+                hist["sum"] += other["sum"]
+                hist["max"] = max(hist["max"], other["max"])
+            for event, n in snap["counters"].items():
+                self._counters[event] = self._counters.get(event, 0) + n
+            for url, other in snap["pages"].items():
+                page = self._pages.setdefault(url, {})
+                for stage, seconds in other.items():
+                    page[stage] = page.get(stage, 0.0) + seconds
+
+    def summary(self) -> dict[str, any]:
+        # JSON-friendly: {"stages": {stage: {name: stats}}, "counters": {...},
+        # "hosts": {host: {"requests", "throttle_events", "backoff_s", "waited_s"}}}
+        snap = self.snapshot()
+        stages: dict[str, dict[str, any]] = {}
+        for (stage, name), hist in sorted(snap["stages"].items()):
+            stages.setdefault(stage, {})[name or "all"] = {
+                "count": hist["count"],
+                "total_s": round(hist["sum"], 4),
+                "mean_s": round(hist["sum"] / hist["count"], 4),
+                "max_s": round(hist["max"], 4),
+            }
+        return {"stages": stages, "counters": snap["counters"], "hosts": self.host_stats()}
+
+    def to_prometheus(self) -> str:
+        def _label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        snap = self.snapshot()
+        lines = [
+            "# HELP content_agent_stage_seconds Time spent per audit stage.",
+            "# TYPE content_agent_stage_seconds histogram",
+        ]
+        for (stage, name), hist in sorted(snap["stages"].items()):
+            labels = f'stage="{_label(stage)}",name="{_label(name)}"'
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), hist["buckets"]):
+                cumulative += n
+                lines.append(f'content_agent_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"content_agent_stage_seconds_sum{{{labels}}} {hist['sum']:.6f}")
+            lines.append(f"content_agent_stage_seconds_count{{{labels}}} {hist['count']}")
+        lines += [
+            "# HELP content_agent_events_total Audit event counters.",
+            "# TYPE content_agent_events_total counter",
+        ]
+        for event, n in sorted(snap["counters"].items()):
+            lines.append(f'content_agent_events_total{{event="{_label(event)}"}} {n:g}')
+        hosts = self.host_stats()
+        for metric, key, help_text in (
+            ("content_agent_host_requests_total", "requests", "Requests sent per host."),
+            ("content_agent_host_throttle_events_total", "throttle_events",
+             "429 responses (host backoffs) per host."),
+            ("content_agent_host_backoff_seconds_total", "backoff_s",
+             "Backoff time requested by 429s per host."),
+            ("content_agent_host_wait_seconds_total", "waited_s",
+             "Time fetch workers waited on the host rate limit or backoff."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for host, stats in hosts.items():
+                lines.append(f'{metric}{{host="{_label(host)}"}} {stats[key]:g}')
+        return "\n".join(lines) + "\n"
+
+
+class _PageScope:
+    def __init__(self, local: threading.local, url: str):
+        self.local = local
+        self.url = url
+
+    def __enter__(self):
+        self.previous = getattr(self.local, "url", None)
+        self.local.url = self.url
+        return self
+
+    def __exit__(self, *exc):
+        self.local.url = self.previous
+        return False
+
+
+INSTRUMENTS = Instruments()
+
+
+def serve_metrics(port: int, instruments: Instruments = INSTRUMENTS, host: str = "127.0.0.1"):
+    # Prometheus text endpoint (GET /metrics) on a daemon thread
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = instruments.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ValidatorCache:
+    # SQLite store of url -> (ETag, Last-Modified, zlib-compressed body)
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS http_cache ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,"
+            " encoding TEXT, body BLOB, stored_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> dict[str, any] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, encoding, body FROM http_cache WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, encoding, body = row
+        return {"etag": etag, "last_modified": last_modified, "encoding": encoding, "body": zlib.decompress(body)}
+
+    def put(self, url: str, etag: str | None, last_modified: str | None, encoding: str | None, body: bytes) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, encoding, zlib.compress(body), time.time()),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# Bodies are streamed in chunks and cut off at MAX_PAGE_BYTES, so
+# one huge page can't blow up a worker's memory; a truncated page is still
+# parsed. Responses that declare a non-HTML Content-Type are dropped unread.
+# Error and 304 responses are read to the end when they are empty or short,
+# so their keep-alive connection goes back to the pool instead of closing.
+MAX_PAGE_BYTES = int(os.getenv("MAX_PAGE_BYTES", 5_000_000))
+FETCH_CHUNK_BYTES = 64 * 1024
+DRAIN_MAX_BYTES = FETCH_CHUNK_BYTES
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+_HEADER_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+
+
+class PageRejected(Exception):
+    # a response we refuse to download or parse (e.g. not HTML)
+    pass
+
+
+def _known_encoding(name: str | None) -> str | None:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+
+def sniff_encoding(content_type: str, head: bytes) -> str:
+    # Encoding from the first chunk only: BOM, then the Content-Type charset,
+    # then <meta charset> / http-equiv, else UTF-8. requests would otherwise
+    # fall back to ISO-8859-1 or guess over the whole body.
+    for bom, name in ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if head.startswith(bom):
+            return name
+    match = _HEADER_CHARSET.search(content_type or "")
+    encoding = _known_encoding(match.group(1)) if match else None
+    if encoding is None:
+        match = _META_CHARSET.search(head)
+        encoding = _known_encoding(match.group(1)) if match else None
+    return encoding or "utf-8"
+
+
+def read_page_body(resp: requests.Response, url: str, max_bytes: int = MAX_PAGE_BYTES) -> requests.Response:
+    # Fills resp.content from a stream=True response, bounded by max_bytes,
+    # and sets resp.encoding from the first chunk. Only the status and headers
+    # of other responses matter; short bodies are drained, long ones dropped.
+    resp.truncated = False
+    if resp.status_code != 200:
+        declared = resp.headers.get("Content-Length", "")
+        if resp.status_code in (204, 304) or (declared.isdigit() and int(declared) <= DRAIN_MAX_BYTES):
+            resp.content
+        resp.close()
+        resp._content = b""
+        return resp
+    content_type = resp.headers.get("Content-Type", "")
+    mime = content_type.split(";", 1)[0].strip().lower()
+    if mime and mime not in HTML_CONTENT_TYPES:
+        resp.close()
+        raise PageRejected(f"not HTML ({mime})")
+    declared = resp.headers.get("Content-Length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        logger.warning(f"⚠️ {url} is {int(declared):,} bytes; only the first {max_bytes:,} will be analyzed.")
+    body = bytearray()
+    encoding = None
+    try:
+        for chunk in resp.iter_content(FETCH_CHUNK_BYTES):
+            if encoding is None:
+                encoding = sniff_encoding(content_type, bytes(chunk))
+            body += chunk
+            if len(body) >= max_bytes:
+                del body[max_bytes:]
+                resp.truncated = True
+                INSTRUMENTS.count("pages_truncated")
+                break
+    finally:
+        resp.close()
+    resp._content = bytes(body)
+    resp.encoding = encoding or sniff_encoding(content_type, b"")
+    return resp
+
+
+class HttpClient:
+    # Shared HTTP layer: one keep-alive Session whose connection pool is sized
+    # to the crawl concurrency, compressed transfer, and conditional GETs.
+    def __init__(self, pool_size: int = 8, timeout: float = 10, user_agent: str = USER_AGENT,
+                 cache_path: str | None = HTTP_CACHE_PATH, max_bytes: int = MAX_PAGE_BYTES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": user_agent, "Accept-Encoding": ACCEPT_ENCODING})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.validators = ValidatorCache(cache_path) if cache_path else None
+
+    def get(self, url: str, headers: dict[str, str] | None = None, timeout: float | None = None) -> requests.Response:
+        headers = dict(headers or {})
+        cached = self.validators.get(url) if self.validators else None
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = self.session.get(url, headers=headers, timeout=timeout or self.timeout, stream=True)
+        resp.from_cache = False
+        resp.validator = None
+        read_page_body(resp, url, self.max_bytes)
+        if resp.status_code == 304 and cached:
+            # serve the stored body as if the server had sent it again
+            resp.status_code = 200
+            resp._content = cached["body"]
+            resp.encoding = cached["encoding"]
+            resp.from_cache = True
+            resp.validator = cached["etag"] or cached["last_modified"]
+        elif resp.status_code == 200 and self.validators:
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.validators.put(url, etag, last_modified, resp.encoding, resp.content)
+                resp.validator = etag or last_modified
+        return resp
+
+
+# Page chrome removed before any check runs
+STRIPPED_TAGS = ['header','footer','nav','aside','form','noscript','script','style']
+
+# "html.parser" (BeautifulSoup, pure Python), "lxml" (native lxml.html tree) or
+# "selectolax" (lexbor). The fast backends drop STRIPPED_TAGS subtrees in C
+# right after parsing; PageIndex reads all three the same way.
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "html.parser")
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+# lexbor parses <noscript> in <head> as if scripting were off, so a tracking
+# pixel (<noscript><img …></noscript>) is moved into <body> before
+# strip_tags() could drop it. For selectolax, noscript blocks are cut out of
+# the text before parsing instead.
+_NOSCRIPT_BLOCK = re.compile(r"<noscript\b.*?</noscript\s*>", re.I | re.S)
+
+# A cleaned page as returned by clean_html(): a BeautifulSoup for the default
+# backend, an lxml root element or a selectolax LexborHTMLParser otherwise.
+ParsedPage = BeautifulSoup
+
+
+def clean_html(html: str | bytes, backend: str | None = None, encoding: str | None = None) -> ParsedPage:
+    # html may be the raw body (bytes) plus the encoding found by
+    # sniff_encoding(); lxml decodes it natively, the others get text.
+    backend = backend or PARSER_BACKEND
+    if isinstance(html, bytes) and backend != "lxml":
+        html = html.decode(encoding or "utf-8", errors="replace")
+    if backend == "lxml":
+        import lxml.html
+        from lxml import etree
+        if isinstance(html, str):
+            html, encoding = html.encode("utf-8"), "utf-8"
+        try:
+            root = lxml.html.document_fromstring(
+                html, parser=lxml.html.HTMLParser(encoding=encoding or "utf-8"))
+        except etree.ParserError:  # empty document
+            root = lxml.html.document_fromstring("<html></html>")
+        etree.strip_elements(root, *STRIPPED_TAGS, with_tail=False)
+        return root
+    if backend == "selectolax":
+        from selectolax.lexbor import LexborHTMLParser
+        html = _NOSCRIPT_BLOCK.sub("", html)
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(STRIPPED_TAGS)
+        return tree
+    if backend != "html.parser":
+        raise ValueError(f"Unknown parser backend: {backend!r} (expected one of {PARSER_BACKENDS})")
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup.find_all(STRIPPED_TAGS):
+        tag.decompose()
+    return soup
+
+
+# Cleaned soups of validated responses keyed by (url, ETag/Last-Modified), so
+# a 304 reuses the parsed page instead of parsing the same HTML again.
+_PARSED_MEMO_SIZE = 128
+_parsed_memo: OrderedDict[tuple[str, str], ParsedPage] = OrderedDict()
+_parsed_memo_lock = threading.Lock()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After is either delay-seconds or an HTTP-date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostScheduler:
+    # Token bucket per host, shared by every fetch worker. A 429 backs off the
+    # whole host (not just the request that saw it); other hosts are untouched.
+    def __init__(self, rate: float = 5.0, burst: int = 5, max_backoff: float = 300.0):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._hosts: dict[str, dict[str, float]] = {}
+        INSTRUMENTS.watch_hosts(self)
+
+    def _state(self, host: str) -> dict[str, float]:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                "tokens": float(self.burst),
+                "refilled_at": time.monotonic(),
+                "blocked_until": 0.0,
+                "requests": 0,
+                "throttle_events": 0,
+                "backoff_s": 0.0,
+                "waited_s": 0.0,
+            }
+        return state
+
+    def _delay(self, state: dict[str, float], now: float) -> float:
+        if self.rate > 0:
+            elapsed = now - state["refilled_at"]
+            state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * self.rate)
+        state["refilled_at"] = now
+        delay = max(0.0, state["blocked_until"] - now)
+        if self.rate > 0 and state["tokens"] < 1:
+            delay = max(delay, (1 - state["tokens"]) / self.rate)
+        return delay
+
+    def delay(self, url: str) -> float:
+        # seconds until a request to this URL's host could go out (0 = now)
+        with self._lock:
+            return self._delay(self._state(urlparse(url).netloc), time.monotonic())
+
+    def acquire(self, url: str) -> None:
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                state = self._state(host)
+                delay = self._delay(state, time.monotonic())
+                if delay <= 0:
+                    if self.rate > 0:
+                        state["tokens"] -= 1
+                    state["requests"] += 1
+                    return
+                state["waited_s"] += delay
+            time.sleep(delay)
+
+    def backoff(self, url: str, seconds: float) -> None:
+        seconds = min(max(0.0, seconds), self.max_backoff)
+        with self._lock:
+            state = self._state(urlparse(url).netloc)
+            now = time.monotonic()
+            new_until = now + seconds
+            if new_until > state["blocked_until"]:
+                state["backoff_s"] += new_until - max(now, state["blocked_until"])
+                state["blocked_until"] = new_until
+            state["throttle_events"] += 1
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                host: {
+                    "requests": int(state["requests"]),
+                    "throttle_events": int(state["throttle_events"]),
+                    "backoff_s": round(state["backoff_s"], 3),
+                    "waited_s": round(state["waited_s"], 3),
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+class HostThrottled(Exception):
+    # a 429 in deferred mode: the host is already backed off in the scheduler
+    # and the caller (Crawler) re-queues the URL instead of a worker waiting
+    pass
+
+
+def fetch_response(url: str, max_retries: int = 3, backoff_factor: int = 2,
+                   session: HttpClient | requests.Session | None = None,
+                   scheduler: HostScheduler | None = None,
+                   throttle_attempt: int | None = None) -> requests.Response | None:
+    # With a scheduler and throttle_attempt (the number of 429s this URL has
+    # already had), a 429 backs off the host and raises HostThrottled right
+    # away; otherwise the retry waits here.
+    http = session or requests
     headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; SEO-Analyzer/1.0; +https://example.com/bot)"
+        "User-Agent": USER_AGENT
     }
     wait = 1
     for attempt in range(1, max_retries + 1):
+        if scheduler is not None:
+            with INSTRUMENTS.timed("throttle"):
+                scheduler.acquire(url)
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
+            with INSTRUMENTS.timed("http"):
+                if isinstance(http, HttpClient):
+                    resp = http.get(url, headers=headers, timeout=10)
+                else:
+                    resp = read_page_body(http.get(url, headers=headers, timeout=10, stream=True), url)
+            INSTRUMENTS.count("http_requests")
+            if getattr(resp, "from_cache", False):
+                INSTRUMENTS.count("http_not_modified")
             resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            for tag in soup.find_all(['header','footer','nav','aside','form','noscript','script','style']):
-                tag.decompose()
-            return soup
+            return resp
+        except PageRejected as e:
+            logger.warning(f"❌ Skipping {url}: {e}.")
+            INSTRUMENTS.count("pages_rejected")
+            return None
         except requests.exceptions.HTTPError as e:
             status = e.response.status_code
+            INSTRUMENTS.count(f"http_{status}")
             if status == 429:
-                retry_after = e.response.headers.get("Retry-After")
-                if retry_after and retry_after.isdigit():
-                    wait = int(retry_after)
-                st.write(f"⚠️ Received 429 for {url}. Waiting {wait}s before retrying… (Attempt {attempt})")
-                time.sleep(wait)
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                if scheduler is not None and throttle_attempt is not None:
+                    wait = retry_after if retry_after is not None else backoff_factor ** throttle_attempt
+                    logger.warning(f"⚠️ Received 429 for {url}. Pausing the host for {wait:g}s and re-queueing… "
+                                   f"(Attempt {throttle_attempt + 1})")
+                    scheduler.backoff(url, wait)
+                    raise HostThrottled(url)
+                if retry_after is not None:
+                    wait = retry_after
+                logger.warning(f"⚠️ Received 429 for {url}. Waiting {wait:g}s before retrying… (Attempt {attempt})")
+                if scheduler is not None:
+                    # pause every worker on this host; acquire() blocks the retry
+                    scheduler.backoff(url, wait)
+                else:
+                    with INSTRUMENTS.timed("backoff"):
+                        time.sleep(wait)
                 wait *= backoff_factor
                 continue
             else:
-                st.write(f"❌ HTTP {status} error fetching {url}. Skipping.")
+                logger.warning(f"❌ HTTP {status} error fetching {url}. Skipping.")
                 return None
         except requests.exceptions.RequestException as e:
-            st.write(f"⚠️ Request error fetching {url}: {e}. Retrying in {wait}s… (Attempt {attempt})")
-            time.sleep(wait)
+            logger.warning(f"⚠️ Request error fetching {url}: {e}. Retrying in {wait}s… (Attempt {attempt})")
+            INSTRUMENTS.count("http_request_errors")
+            with INSTRUMENTS.timed("backoff"):
+                time.sleep(wait)
             wait *= backoff_factor
             continue
-    st.write(f"❌ Failed to fetch {url} after {max_retries} attempts.")
+    logger.warning(f"❌ Failed to fetch {url} after {max_retries} attempts.")
     return None
 
 
-def list_bold_text(soup: BeautifulSoup) -> list[str]:
-    return [
-        el.get_text(strip=True)
-        for el in soup.find_all(['b','strong'])
-        if el.get_text(strip=True)
-    ]
+def extract_main_content(url: str, max_retries: int = 3, backoff_factor: int = 2,
+                         session: HttpClient | requests.Session | None = None,
+                         scheduler: HostScheduler | None = None,
+                         throttle_attempt: int | None = None) -> ParsedPage | None:
+    resp = fetch_response(url, max_retries, backoff_factor, session, scheduler, throttle_attempt)
+    if resp is None:
+        return None
+    validator = getattr(resp, "validator", None)
+    if validator is None:
+        with INSTRUMENTS.timed("parse"):
+            return clean_html(resp.content, encoding=resp.encoding)
+    key = (url, validator)
+    with _parsed_memo_lock:
+        if key in _parsed_memo:
+            _parsed_memo.move_to_end(key)
+            return _parsed_memo[key]
+    with INSTRUMENTS.timed("parse"):
+        soup = clean_html(resp.content, encoding=resp.encoding)
+    with _parsed_memo_lock:
+        _parsed_memo[key] = soup
+        if len(_parsed_memo) > _PARSED_MEMO_SIZE:
+            _parsed_memo.popitem(last=False)
+    return soup
+
+
+# -----------------------------------------------------------------------------
+# SECTION 1B: PAGE CHECK HELPERS
+# -----------------------------------------------------------------------------
+
+# Every tag the checks look at. PageIndex buckets them in a single find_all()
+# traversal, with text pre-stripped, instead of one DOM walk per check.
+INDEXED_TAGS = [
+    'html', 'title', 'meta',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'p', 'ul', 'ol', 'b', 'strong', 'img', 'a',
+]
+HEADING_LEVELS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+TEXT_TAGS = ('title', *HEADING_LEVELS, 'p', 'b', 'strong', 'a')
+
+
+def _page_adapter(doc: ParsedPage, tags: list[str] = INDEXED_TAGS):
+    # (elements, text_of, full_text, html) for a parsed page. elements yields
+    # (tag, attrs, node) for the given tags in document order, in one traversal.
+    if isinstance(doc, BeautifulSoup):
+        return (
+            ((el.name, el.attrs, el) for el in doc.find_all(tags)),
+            lambda el: el.get_text(strip=True),
+            lambda: doc.get_text(strip=True),
+            lambda: str(doc),
+        )
+    if hasattr(doc, "css"):  # selectolax
+        return (
+            ((node.tag, node.attributes, node) for node in doc.css(",".join(tags))),
+            lambda node: node.text(deep=True, separator='', strip=True),
+            lambda: doc.root.text(deep=True, separator='', strip=True) if doc.root else "",
+            lambda: doc.html or "",
+        )
+    from lxml import etree  # lxml root element
+
+    def _text(el):
+        return "".join(t.strip() for t in el.itertext())
+    return (
+        ((el.tag, el.attrib, el) for el in doc.iter(*tags)),
+        _text,
+        lambda: _text(doc),
+        lambda: etree.tostring(doc, encoding="unicode", method="html"),
+    )
+
+
+class PageIndex:
+    def __init__(self, doc: ParsedPage, tags: list[str] | None = None):
+        # tags limits indexing to a subset of INDEXED_TAGS (the rest stay empty)
+        self.doc = doc
+        elements, text_of, self._full_text_fn, self._html_fn = _page_adapter(doc, tags or INDEXED_TAGS)
+        # attribute dicts per tag, valueless attributes (<img alt>) read as ""
+        self.tags: dict[str, list[dict[str, str]]] = {name: [] for name in INDEXED_TAGS}
+        texts: dict[str, list[str]] = {name: [] for name in TEXT_TAGS}
+        bold_texts = []
+        outline = []
+        for name, attrs, node in elements:
+            self.tags[name].append({k: ("" if v is None else v) for k, v in attrs.items()})
+            if name in TEXT_TAGS:
+                text = text_of(node)
+                texts[name].append(text)
+                # the merged lists below keep document order across tag names
+                if name in ('b', 'strong'):
+                    bold_texts.append(text)
+                elif name in HEADING_LEVELS:
+                    outline.append((name, text))
+
+        html_tags = self.tags['html']
+        self.lang: str = (html_tags[0].get('lang') or "") if html_tags else ""
+
+        self.title: str = texts['title'][0] if texts['title'] else ""
+
+        self.meta_description: str = ""
+        for meta in self.tags['meta']:
+            if meta.get('name') == 'description':
+                self.meta_description = meta['content'].strip() if 'content' in meta else ""
+                break
+
+        self.outline: list[tuple[str, str]] = outline
+        self.headings: dict[str, list[str]] = {level: texts[level] for level in HEADING_LEVELS}
+        self.paragraphs: list[str] = texts['p']
+        self.list_count: int = len(self.tags['ul']) + len(self.tags['ol'])
+        self.bold: list[str] = [t for t in bold_texts if t]
+        self.images: list[dict[str, str]] = self.tags['img']
+        self.links: list[tuple[str, str]] = [
+            (attrs['href'], text) for attrs, text in zip(self.tags['a'], texts['a']) if 'href' in attrs
+        ]
+        self._full_text: str | None = None
+        self._html: str | None = None
+
+    @property
+    def full_text(self) -> str:
+        if self._full_text is None:
+            self._full_text = self._full_text_fn()
+        return self._full_text
+
+    @property
+    def html(self) -> str:
+        # serialized cleaned page (used for content fingerprints)
+        if self._html is None:
+            self._html = self._html_fn()
+        return self._html
+
+
+def img_markup(attrs: dict[str, str]) -> str:
+    # an indexed <img> rendered back as HTML (attributes sorted, like bs4), for report examples
+    parts = " ".join(
+        f'{k}="{html_lib.escape(v if isinstance(v, str) else " ".join(v))}"'  # bs4 keeps class etc. as lists
+        for k, v in sorted(attrs.items())
+    )
+    return f"<img {parts}/>" if parts else "<img/>"
+
 
+def list_bold_text(index: PageIndex) -> list[str]:
+    return index.bold
 
-def count_bold_text(soup: BeautifulSoup) -> bool:
-    bold_texts = list_bold_text(soup)
-    return len(bold_texts) < 8
 
+def count_bold_text(index: PageIndex) -> bool:
+    return len(index.bold) < 8
 
-def bold_words(soup: BeautifulSoup) -> bool:
-    for txt in list_bold_text(soup):
+
+def bold_words(index: PageIndex) -> bool:
+    for txt in index.bold:
         if len(txt.split()) > 7:
             return True
     return False
 
 
-def analyze_images(soup: BeautifulSoup) -> bool:
-    image_alt = [
-        img.get('alt')
-        for img in soup.find_all('img')
-        if img.get('alt') and 'logo' not in img.get('alt').lower()
-    ]
-    return len(image_alt) < 3
+def analyze_images(index: PageIndex) -> bool:
+    return len(show_images_text(index)) < 3
 
 
-def analyze_images_text(soup: BeautifulSoup) -> bool:
-    image_alt = [
-        img.get('alt')
-        for img in soup.find_all('img')
-        if img.get('alt') and 'logo' not in img.get('alt').lower()
-    ]
-    total = sum(1 for img in soup.find_all('img') if img.get('alt') and 'logo' not in img.get('alt').lower())
+def analyze_images_text(index: PageIndex) -> bool:
+    image_alt = show_images_text(index)
+    total = len(image_alt)
     return (total > 0 and not image_alt)
 
 
-def show_images_text(soup: BeautifulSoup) -> list[str]:
+def show_images_text(index: PageIndex) -> list[str]:
     return [
         img.get('alt')
-        for img in soup.find_all('img')
+        for img in index.images
         if img.get('alt') and 'logo' not in img.get('alt').lower()
     ]
 
 
-def analyze_meta_title(soup: BeautifulSoup) -> int:
-    title = soup.find('title')
-    title_text = title.get_text(strip=True) if title else ""
-    char_count = len(title_text)
+def analyze_meta_title(index: PageIndex) -> int:
+    char_count = len(index.title)
     if char_count < 30:
         return 0
     elif char_count > 60:
@@ -109,15 +878,12 @@ def analyze_meta_title(soup: BeautifulSoup) -> int:
         return 10
 
 
-def meta_title_show(soup: BeautifulSoup) -> str:
-    title = soup.find('title')
-    return title.get_text(strip=True) if title else ""
+def meta_title_show(index: PageIndex) -> str:
+    return index.title
 
 
-def analyze_meta_description(soup: BeautifulSoup) -> int:
-    meta = soup.find('meta', attrs={'name': 'description'})
-    desc = meta['content'].strip() if (meta and 'content' in meta.attrs) else ""
-    char_count = len(desc)
+def analyze_meta_description(index: PageIndex) -> int:
+    char_count = len(index.meta_description)
     if char_count < 120:
         return 0
     elif char_count > 160:
@@ -126,71 +892,144 @@ def analyze_meta_description(soup: BeautifulSoup) -> int:
         return 10
 
 
-def meta_description(soup: BeautifulSoup) -> str:
-    meta = soup.find('meta', attrs={'name': 'description'})
-    return meta['content'].strip() if (meta and 'content' in meta.attrs) else ""
+def meta_description(index: PageIndex) -> str:
+    return index.meta_description
 
 
-def analyze_h1(soup: BeautifulSoup) -> bool:
-    h1_tags = soup.find_all('h1')
-    return len(h1_tags) > 1
+def analyze_h1(index: PageIndex) -> bool:
+    return len(index.headings['h1']) > 1
 
 
-def h1_show(soup: BeautifulSoup) -> str:
-    h1 = soup.find('h1')
-    return h1.get_text(strip=True) if h1 else ""
+def h1_show(index: PageIndex) -> str:
+    return index.headings['h1'][0] if index.headings['h1'] else ""
 
 
-def analyze_h3(soup: BeautifulSoup) -> bool:
-    return soup.find('h3') is None
+def analyze_h3(index: PageIndex) -> bool:
+    return not index.headings['h3']
 
 
-def analyze_h5_and_h6(soup: BeautifulSoup) -> bool:
-    return bool(soup.find('h5') or soup.find('h6'))
+def analyze_h5_and_h6(index: PageIndex) -> bool:
+    return bool(index.headings['h5'] or index.headings['h6'])
 
 
-def analyze_paragraphs(soup: BeautifulSoup) -> dict[str, str]:
+# Words that end in a period without ending the sentence, per language code.
+# In ORDINAL_LANGS ordinals are written "3." too, so a number before the
+# period doesn't end a sentence either.
+SENTENCE_ABBREVIATIONS = {
+    "en": {"e.g", "i.e", "mr", "mrs", "ms", "dr", "vs"},
+    "hr": {"npr", "tj", "dr", "sl", "br", "str", "god", "sv", "prof"},
+    "sr": {"npr", "tj", "dr", "sl", "br", "str", "god", "sv", "prof"},
+    "bs": {"npr", "tj", "dr", "sl", "br", "str", "god", "sv", "prof"},
+    "de": {"z.b", "d.h", "u.a", "bzw", "ca", "dr", "nr", "vgl", "inkl"},
+    "fr": {"m", "mme", "p.ex", "env", "cf", "dr", "n°"},
+    "es": {"sr", "sra", "dr", "p.ej", "pág", "núm", "ej"},
+}
+# Also ordinary words ("the answer is no."), so only abbreviations when a
+# number follows ("No. 5")
+NUMBER_ABBREVIATIONS = {
+    "en": {"no"},
+}
+ORDINAL_LANGS = {"hr", "sr", "bs", "de"}
+_SENTENCE_END = re.compile(r'[.!?]+(?=\s|$)')
+
+
+def split_sentences(text: str, lang: str = "") -> list[str]:
+    # sentences with their end punctuation; unknown languages only split on .!?
+    abbreviations = SENTENCE_ABBREVIATIONS.get(lang, ())
+    before_number = NUMBER_ABBREVIATIONS.get(lang, ())
+    ordinals = lang in ORDINAL_LANGS
+    sentences, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        if match.group() == "." and (abbreviations or before_number or ordinals):
+            last = text[start:match.start()].rsplit(None, 1)
+            word = last[-1].lstrip("([\"'“„«").lower() if last else ""
+            if word in abbreviations or (ordinals and word.isdigit()):
+                continue
+            if word in before_number and text[match.end():].lstrip()[:1].isdigit():
+                continue
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    sentences.append(text[start:].strip())
+    return [s for s in sentences if s.strip(".!? ")]
+
+
+def analyze_paragraphs(index: PageIndex, lang: str = "") -> dict[str, str]:
     issues = {}
-    for p in soup.find_all('p'):
-        text = p.get_text(strip=True)
-        raw_sentences = re.split(r'[.!?]+(?=\s|$)', text)
-        sentences = [s.strip() for s in raw_sentences if s.strip()]
+    for text in index.paragraphs:
+        sentences = split_sentences(text, lang)
         if len(sentences) > 3:
             issues[text] = "space off after 2-3 sentences"
     return issues
 
 
-def analyze_bullet_lists(soup: BeautifulSoup) -> bool:
-    return not bool(soup.find_all(['ul','ol']))
+def analyze_bullet_lists(index: PageIndex) -> bool:
+    return index.list_count == 0
 
 
-def analyze_banner(soup: BeautifulSoup) -> bool:
-    text = soup.get_text(strip=True).lower()
+def analyze_banner(index: PageIndex) -> bool:
+    text = index.full_text.lower()
     for token in ['sign up','subscribe','discount']:
         if token in text:
             return False
     return True
 
 
-def analyze_internal_links(url: str) -> tuple[bool, bool, str]:
-    content_div = extract_main_content(url)
+class PageStore:
+    # Per-run cache of fetched + cleaned pages keyed by URL, so every check
+    # shares one HTTP round trip and one parse per page.
+    def __init__(self, fetch=None, tags: list[str] | None = None):
+        self._fetch = fetch or extract_main_content
+        self._tags = tags
+        self._pages: dict[str, ParsedPage | None] = {}
+        self._indexes: dict[str, PageIndex] = {}
+
+    def get(self, url: str) -> ParsedPage | None:
+        if url not in self._pages:
+            self._pages[url] = self._fetch(url)
+        return self._pages[url]
+
+    def put(self, url: str, soup: ParsedPage | None) -> None:
+        self._pages[url] = soup
+        self._indexes.pop(url, None)
+
+    def discard(self, url: str) -> None:
+        # forget the page (parse tree and index) once nothing needs it
+        self._pages.pop(url, None)
+        self._indexes.pop(url, None)
+
+    def index(self, url: str) -> PageIndex | None:
+        if url not in self._indexes:
+            soup = self.get(url)
+            if soup is None:
+                return None
+            with INSTRUMENTS.timed("index"):
+                self._indexes[url] = PageIndex(soup, self._tags)
+        return self._indexes[url]
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._pages
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+def analyze_internal_links(url: str, index: PageIndex) -> tuple[bool, bool, str]:
     base_domain = urlparse(url).netloc
 
     internal_links = []
-    for a in content_div.find_all("a", href=True):
-        href = a["href"]
+    for href, anchor_text in index.links:
         # Make absolute URL if relative
         full_url = urljoin(url, href)
         link_domain = urlparse(full_url).netloc
         # Check if link is internal
         if link_domain == base_domain:
-            internal_links.append((full_url, a.get_text(strip=True)))
+            internal_links.append((full_url, anchor_text))
 
     too_little_internal_links = len(internal_links) < 5
     too_much_linked_seq = False
     example_long_anchor = ""
 
-    for url, anchor_text in internal_links:
+    for _link_url, anchor_text in internal_links:
         if len(anchor_text.split()) > 6:
             too_much_linked_seq = True
             example_long_anchor = anchor_text
@@ -200,83 +1039,1433 @@ def analyze_internal_links(url: str) -> tuple[bool, bool, str]:
     return too_little_internal_links, too_much_linked_seq, example_long_anchor
 
 
-def analyze_primary(client: openai.Client, primary: str, text: str) -> bool:
+# -----------------------------------------------------------------------------
+# SECTION 1C: LLM CALLS AND KEYWORD MATCHING
+# -----------------------------------------------------------------------------
+
+# Deterministic (temperature=0) keyword verdicts are cached on disk, keyed by a
+# hash of model + messages. Set LLM_CACHE_PATH="" to disable.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 200_000))
+
+
+class LLMCache:
+    # Content-addressed SQLite cache with TTL expiry and LRU eviction once
+    # the entry count passes max_entries.
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, answer TEXT, created_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict[str, str]]) -> str:
+        payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT answer, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, answer, now, now))
+            self._puts += 1
+            # counting rows on every write is wasteful; prune every 100 puts
+            if self._puts % 100 == 0:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        if self.ttl:
+            self._db.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+_llm_cache: LLMCache | None = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache | None:
+    global _llm_cache
+    if not LLM_CACHE_PATH:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(LLM_CACHE_PATH)
+        return _llm_cache
+
+
+# Async LLM gateway. One asyncio loop (on a daemon thread) drives the async
+# OpenAI client for every caller thread: it caps in-flight requests and
+# tokens per minute, shares one request between identical in-flight prompts,
+# and retries 429/5xx/connection errors with jittered exponential backoff.
+# It quacks like openai.Client (chat.completions.create), the way HttpClient
+# stands in for requests.Session, so callers don't change.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))  # 0 = no limit
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", 1.0))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", 60.0))
+# completion tokens reserved per request until the real usage is known
+LLM_COMPLETION_ESTIMATE = 200
+
+
+class LLMUnavailableError(RuntimeError):
+    # an LLM request that still failed after the gateway's retries
+    pass
+
+
+def _llm_retry_after(exc: Exception) -> float | None:
+    # seconds the API asked us to wait, or None if exc is not retryable
+    if isinstance(exc, openai.APIConnectionError):  # includes timeouts
+        return 0.0
+    if isinstance(exc, openai.APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500):
+        return parse_retry_after(exc.response.headers.get("retry-after")) or 0.0
+    return None
+
+
+class _TokenBudget:
+    # tokens-per-minute bucket; lives on the gateway loop, so no locking
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    async def take(self, tokens: float) -> None:
+        tokens = min(tokens, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def settle(self, estimated: float, actual: float) -> None:
+        self.tokens -= actual - estimated
+
+
+class LLMGateway:
+    def __init__(self, client: openai.AsyncOpenAI | None = None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE, max_retries: int = LLM_MAX_RETRIES,
+                 retry_base: float = LLM_RETRY_BASE, retry_max: float = LLM_RETRY_MAX):
+        self.client = client or openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.coalesced = 0
+        self.retries = 0
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._budget = _TokenBudget(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._in_flight: dict[str, asyncio.Future] = {}
+        threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True).start()
+
+    # openai.Client-compatible surface: gateway.chat.completions.create(...)
+    @property
+    def chat(self):
+        return self
+
+    @property
+    def completions(self):
+        return self
+
+    def create(self, **request):
+        if request.get("stream"):
+            return self._stream(request)
+        return asyncio.run_coroutine_threadsafe(self._as_job(_log_job.get(), self.acreate(**request)),
+                                                self._loop).result()
+
+    @staticmethod
+    async def _as_job(job: str | None, coro):
+        # the caller's analysis job carries over to the event loop's logging
+        _log_job.set(job)
+        return await coro
+
+    async def acreate(self, **request):
+        # identical requests already on their way share that one response
+        key = hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+                             .encode("utf-8")).hexdigest()
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            INSTRUMENTS.count("llm_coalesced")
+            return await asyncio.shield(shared)
+        task = self._in_flight[key] = asyncio.ensure_future(self._send(request))
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _send(self, request: dict[str, any]):
+        estimated = 0.0
+        if self._budget is not None:
+            prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+            estimated = prompt_chars / 4 + LLM_COMPLETION_ESTIMATE  # ~4 characters per token
+        for attempt in range(self.max_retries + 1):
+            if self._budget is not None:
+                await self._budget.take(estimated)
+            try:
+                async with self._semaphore:
+                    response = await self.client.chat.completions.create(**request)
+            except Exception as exc:
+                if self._budget is not None:
+                    self._budget.settle(estimated, 0)  # nothing was spent
+                retry_after = _llm_retry_after(exc)
+                if retry_after is None:
+                    raise
+                if attempt == self.max_retries:
+                    raise LLMUnavailableError(f"LLM request failed after {attempt + 1} attempts: {exc}") from exc
+                # full jitter, but never sooner than the server asked for
+                delay = max(retry_after, random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt)))
+                self.retries += 1
+                INSTRUMENTS.count("llm_retries")
+                logger.warning(f"⚠️ LLM request failed ({exc.__class__.__name__}); retrying in {delay:.1f}s…")
+                await asyncio.sleep(delay)
+                continue
+            usage = getattr(response, "usage", None)
+            if self._budget is not None and usage is not None and not request.get("stream"):
+                self._budget.settle(estimated, getattr(usage, "total_tokens", 0) or estimated)
+            return response
+
+    def _stream(self, request: dict[str, any]) -> Iterator[any]:
+        # Streamed completions: chunks are handed over to the calling thread
+        # through a queue. Retries only cover opening the stream.
+        chunks: queue.Queue = queue.Queue()
+        done = object()
+
+        async def _pump():
+            try:
+                stream = await self._send(request)
+                async for chunk in stream:
+                    chunks.put(chunk)
+            except Exception as exc:
+                chunks.put(exc)
+            finally:
+                chunks.put(done)
+
+        asyncio.run_coroutine_threadsafe(_pump(), self._loop)
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def _count_llm_usage(response) -> None:
+    INSTRUMENTS.count("llm_calls")
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        INSTRUMENTS.count("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        INSTRUMENTS.count("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def cached_completion(client: openai.Client, messages: list[dict[str, str]], model: str = "gpt-4o-mini",
+                      cache: LLMCache | None = None, response_format: dict[str, str] | None = None) -> str:
+    # Only for temperature=0 calls. API errors propagate and are never cached.
+    cache = cache or get_llm_cache()
+    extra = {"response_format": response_format} if response_format else {}
+    key = LLMCache.make_key(model, messages + ([extra] if extra else [])) if cache else None
+    if cache:
+        answer = cache.get(key)
+        if answer is not None:
+            INSTRUMENTS.count("llm_cache_hits")
+            return answer
+    with INSTRUMENTS.timed("llm", model):
+        response = client.chat.completions.create(model=model, messages=messages, temperature=0, **extra)
+    _count_llm_usage(response)
+    answer = response.choices[0].message.content.strip()
+    if cache:
+        cache.put(key, answer)
+    return answer
+
+
+def _language_note(lang: str | None) -> str:
+    # prompt sentence naming the page language, for languages LANGUAGE_MAP knows
+    name = LANGUAGE_MAP.get(lang or "")
+    return f"The website is written in {name}, so judge matches in {name}. " if name else ""
+
+
+def analyze_primary(client: openai.Client, primary: str, text: str, lang: str | None = None) -> bool:
     if not primary or not text:
         return False
 
     prompt = (
         "You are a helpful assistant specialized in analyzing the content of the website. "
+        + _language_note(lang) +
         f"Try to find this element {primary} by finding its contextual and semantic match in the following text: {text} "
         "A match is considered even if the words don't match exactly but the concept or idea matches. "
         "Answer only 'yes' or 'no'."
     )
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a semantic analysis tool for SEO keywords."},
-                {"role": "user",   "content": prompt}
-            ],
-            temperature=0
-        )
-        answer = response.choices[0].message.content.strip().lower()
-        return "yes" in answer
-    except Exception:
-        return False
+    # API errors propagate: a failed request is not a missing keyword
+    answer = cached_completion(
+        client,
+        messages=[
+            {"role": "system", "content": "You are a semantic analysis tool for SEO keywords."},
+            {"role": "user",   "content": prompt}
+        ],
+    )
+    return "yes" in answer.lower()
 
 
-def analyze_sec(client: openai.Client, secondaries: list[str], text: str) -> bool:
+def analyze_sec(client: openai.Client, secondaries: list[str], text: str, lang: str | None = None) -> bool:
     if not secondaries or not text:
         return False
 
     prompt = (
         "You are a helpful assistant specialized in analyzing the content of the website. "
+        + _language_note(lang) +
         f"Try to find each element of {secondaries} by finding its contextual and semantic match in the following text: {text} "
         "A match is considered even if the words don't match exactly but the concept or idea matches. "
         "Answer only 'yes' or 'no'."
     )
+    answer = cached_completion(
+        client,
+        messages=[
+            {"role": "system", "content": "You are a semantic analysis tool for SEO secondary keywords."},
+            {"role": "user",   "content": prompt}
+        ],
+    )
+    return "yes" in answer.lower()
+
+
+def _parse_batch_verdict(answer: str, fields: list[str], secondaries: list[str]) -> dict[str, any] | None:
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a semantic analysis tool for SEO secondary keywords."},
-                {"role": "user",   "content": prompt}
-            ],
-            temperature=0
-        )
-        answer = response.choices[0].message.content.strip().lower()
-        return "yes" in answer
-    except Exception:
+        data = json.loads(answer)
+        primary = data.get("primary", {})
+        secondary = data.get("secondary", {})
+        if not isinstance(primary, dict) or not isinstance(secondary, dict):
+            return None
+        verdict = {"primary": {}, "secondary": {}}
+        for field in fields:
+            if not isinstance(primary.get(field), bool):
+                return None
+            verdict["primary"][field] = primary[field]
+        for kw in secondaries:
+            if not isinstance(secondary.get(kw), bool):
+                return None
+            verdict["secondary"][kw] = secondary[kw]
+        return verdict
+    except (ValueError, AttributeError):
+        return None
+
+
+def analyze_keywords_batch(client: openai.Client, primary: str, secondaries: list[str],
+                           fields: dict[str, str], body: str, lang: str | None = None) -> dict[str, any] | None:
+    # One JSON-mode request covering every keyword check on a page. Returns
+    # {"primary": {field: bool}, "secondary": {kw: bool}}, or None if the
+    # reply can't be parsed (the caller then falls back to per-field calls).
+    asked_fields = [name for name, text in fields.items() if primary and text]
+    asked_secondaries = secondaries if body else []
+    if not asked_fields and not asked_secondaries:
+        return {"primary": {}, "secondary": {}}
+
+    prompt = (
+        "You are a helpful assistant specialized in analyzing the content of the website. "
+        + _language_note(lang) +
+        "For each text below, decide whether the given keyword has a contextual and semantic match in it. "
+        "A match is considered even if the words don't match exactly but the concept or idea matches.\n\n"
+    )
+    if asked_fields:
+        prompt += f"Primary keyword: {primary}\n"
+        for name in asked_fields:
+            prompt += f"[{name}]: {fields[name]}\n"
+    if asked_secondaries:
+        prompt += f"\nSecondary keywords, each checked against [body]: {asked_secondaries}\n[body]: {body}\n"
+    prompt += (
+        "\nAnswer with a JSON object only, in this shape: "
+        + json.dumps({
+            "primary": {name: True for name in asked_fields},
+            "secondary": {kw: True for kw in asked_secondaries},
+        }, ensure_ascii=False)
+        + " using true or false for every entry."
+    )
+    answer = cached_completion(
+        client,
+        messages=[
+            {"role": "system", "content": "You are a semantic analysis tool for SEO keywords."},
+            {"role": "user",   "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+    )
+    return _parse_batch_verdict(answer, asked_fields, asked_secondaries)
+
+
+class LLMKeywordMatcher:
+    # Every keyword check answered by the chat model (batched, see above)
+    def match_page(self, client: openai.Client, primary: str, secondaries: list[str],
+                   fields: dict[str, str], body: str, lang: str | None = None) -> dict[str, bool]:
+        # API errors propagate (the gateway has already retried them)
+        verdict = analyze_keywords_batch(client, primary, secondaries, fields, body, lang)
+
+        if verdict is None:
+            matches = {name: analyze_primary(client, primary, text, lang) for name, text in fields.items()}
+            matches["secondary"] = analyze_sec(client, secondaries, body, lang)
+            return matches
+
+        matches = {name: verdict["primary"].get(name, False) for name in fields}
+        found = verdict["secondary"]
+        matches["secondary"] = bool(secondaries and body and found and all(found.values()))
+        return matches
+
+
+# Local matcher settings. Cosine scores >= ACCEPT count as a match, <= REJECT as
+# no match; anything in between is ambiguous and goes to the LLM.
+KEYWORD_MATCHER = os.getenv("KEYWORD_MATCHER", "llm")  # "llm" or "local"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+KEYWORD_MATCH_ACCEPT = float(os.getenv("KEYWORD_MATCH_ACCEPT", 0.6))
+KEYWORD_MATCH_REJECT = float(os.getenv("KEYWORD_MATCH_REJECT", 0.3))
+
+# English-only suffix stripping; a stem must keep 4+ letters ("news" stays
+# "news", not "new").
+_INFLECTION_SUFFIXES = ("ings", "ing", "edly", "ed", "es", "ly", "s")
+_MIN_STEM_LEN = 4
+
+
+def _normalize_text(text: str) -> str:
+    # casefolded, accents stripped, punctuation collapsed to single spaces
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def _stem(token: str) -> str:
+    for suffix in _INFLECTION_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM_LEN:
+            return token[:-len(suffix)]
+    return token
+
+
+def exact_keyword_match(keyword: str, text: str, lang: str | None = None) -> bool:
+    # The keyword as a phrase, or (English pages) its stems adjacent and in
+    # order. Anything looser is left to the embedding / LLM path.
+    keyword_norm = _normalize_text(keyword)
+    if not keyword_norm:
+        return False
+    text_norm = _normalize_text(text)
+    if f" {keyword_norm} " in f" {text_norm} ":
+        return True
+    if (lang or DEFAULT_LANG) != "en":
         return False
+    keyword_stems = " ".join(_stem(tok) for tok in keyword_norm.split())
+    text_stems = " ".join(_stem(tok) for tok in text_norm.split())
+    return f" {keyword_stems} " in f" {text_stems} "
+
+
+def _text_chunks(text: str, max_words: int = 60, lang: str = "") -> list[str]:
+    # sentence-ish windows, so one long body doesn't dilute a single embedding
+    chunks, current = [], []
+    for sentence in split_sentences(text, lang):
+        words = sentence.split()
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+        while len(current) > max_words:
+            chunks.append(" ".join(current[:max_words]))
+            current = current[max_words:]
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class SentenceEmbedder:
+    # CPU-only sentence-transformers model (loaded on first use) with an
+    # in-memory LRU of unit-length vectors keyed by text.
+    def __init__(self, model_name: str = EMBEDDING_MODEL, cache_size: int = 50_000):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._model = None
+        self._vectors: OrderedDict[str, any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name, device="cpu")
+
+    def encode(self, texts: list[str]):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            missing = list(dict.fromkeys(t for t in texts if t not in self._vectors))
+            if missing:
+                encoded = self._model.encode(missing, batch_size=64, normalize_embeddings=True,
+                                             convert_to_numpy=True, show_progress_bar=False)
+                for text, vector in zip(missing, encoded):
+                    self._vectors[text] = vector
+            for text in texts:
+                self._vectors.move_to_end(text)
+            matrix = np.stack([self._vectors[t] for t in texts])
+            while len(self._vectors) > self.cache_size:
+                self._vectors.popitem(last=False)
+            return matrix
+
+
+class LocalKeywordMatcher:
+    # Exact/stemmed lookup first, then cosine similarity over local embeddings;
+    # only scores between reject and accept are sent to the LLM.
+    def __init__(self, embedder: SentenceEmbedder | None = None,
+                 accept: float = KEYWORD_MATCH_ACCEPT, reject: float = KEYWORD_MATCH_REJECT):
+        self.accept = accept
+        self.reject = reject
+        self.embedder = embedder
+        if self.embedder is None and np is not None and importlib.util.find_spec("sentence_transformers"):
+            self.embedder = SentenceEmbedder()
+
+    def _classify(self, score: float) -> bool | None:
+        if score >= self.accept:
+            return True
+        if score <= self.reject:
+            return False
+        return None
+
+    def _embedding_verdicts(self, primary: str, fields: dict[str, str], field_names: list[str],
+                            secondaries: list[str], body: str,
+                            lang: str | None = None) -> tuple[dict[str, bool | None], dict[str, bool | None]]:
+        body_chunks = _text_chunks(body, lang=lang or "") if secondaries else []
+        keywords = ([primary] if field_names else []) + secondaries
+        field_texts = [fields[name] for name in field_names]
+        matrix = self.embedder.encode(keywords + field_texts + body_chunks)
+        kw_vecs = matrix[:len(keywords)]
+        field_vecs = matrix[len(keywords):len(keywords) + len(field_texts)]
+        chunk_vecs = matrix[len(keywords) + len(field_texts):]
+
+        field_verdicts = {}
+        if field_names:
+            scores = field_vecs @ kw_vecs[0]
+            field_verdicts = {name: self._classify(float(score)) for name, score in zip(field_names, scores)}
+        secondary_verdicts = {}
+        if secondaries and len(chunk_vecs):
+            # best-matching body chunk per secondary keyword
+            best = (kw_vecs[-len(secondaries):] @ chunk_vecs.T).max(axis=1)
+            secondary_verdicts = {kw: self._classify(float(score)) for kw, score in zip(secondaries, best)}
+        return field_verdicts, secondary_verdicts
+
+    def match_page(self, client: openai.Client, primary: str, secondaries: list[str],
+                   fields: dict[str, str], body: str, lang: str | None = None) -> dict[str, bool]:
+        matches: dict[str, bool | None] = {}
+        for name, text in fields.items():
+            if not primary or not text:
+                matches[name] = False
+            else:
+                matches[name] = True if exact_keyword_match(primary, text, lang) else None
+        secondary: dict[str, bool | None] = {
+            kw: (True if exact_keyword_match(kw, body, lang) else None) if body else False
+            for kw in secondaries
+        }
+
+        open_fields = [name for name, verdict in matches.items() if verdict is None]
+        open_secondaries = [kw for kw, verdict in secondary.items() if verdict is None]
+        if self.embedder is not None and (open_fields or open_secondaries):
+            field_verdicts, secondary_verdicts = self._embedding_verdicts(
+                primary, fields, open_fields, open_secondaries, body, lang)
+            matches.update(field_verdicts)
+            secondary.update(secondary_verdicts)
+
+        for name, verdict in matches.items():
+            if verdict is None:
+                matches[name] = analyze_primary(client, primary, fields[name], lang)
+        undecided = [kw for kw, verdict in secondary.items() if verdict is None]
+        if not secondaries or False in secondary.values():
+            matches["secondary"] = False
+        elif undecided:
+            matches["secondary"] = analyze_sec(client, undecided, body, lang)
+        else:
+            matches["secondary"] = True
+        return matches
+
+
+_keyword_matchers: dict[str, any] = {}
+
+
+def get_keyword_matcher(name: str = KEYWORD_MATCHER):
+    if name not in _keyword_matchers:
+        if name == "local":
+            _keyword_matchers[name] = LocalKeywordMatcher()
+        elif name == "llm":
+            _keyword_matchers[name] = LLMKeywordMatcher()
+        else:
+            raise ValueError(f"Unknown keyword matcher: {name!r} (expected 'llm' or 'local')")
+    return _keyword_matchers[name]
+
+
+def match_page_keywords(client: openai.Client, primary: str, secondaries: list[str],
+                        fields: dict[str, str], body: str, matcher=None, lang: str | None = None) -> dict[str, bool]:
+    # Verdict per primary-keyword field plus "secondary" (all secondaries found)
+    matcher = matcher or get_keyword_matcher()
+    return matcher.match_page(client, primary, secondaries, fields, body, lang=lang)
 
 
 # -----------------------------------------------------------------------------
-# SECTION 2: CSV PARSER (UNCHANGED)
+# SECTION 2: CSV PARSER
 # -----------------------------------------------------------------------------
 
+KEYWORD_CSV_COLUMNS = ("url", "primary kw", "secundary kw")
+
+
+def _open_csv_text(csv_file):
+    # accepts a path or a (binary or text) file-like, e.g. a Streamlit upload
+    if isinstance(csv_file, (str, os.PathLike)):
+        return open(csv_file, newline="", encoding="utf-8-sig")
+    if hasattr(csv_file, "seek"):
+        csv_file.seek(0)
+    if isinstance(csv_file, io.TextIOBase):
+        return csv_file
+    return io.TextIOWrapper(csv_file, encoding="utf-8-sig", newline="")
+
+
+def iter_keyword_groups(csv_file) -> Iterator[tuple[str, str, list[str]]]:
+    # Streams (url, primary, secondaries) groups row by row. A row with a blank
+    # url continues the previous URL's secondaries, so a group is yielded once
+    # the next URL starts (or the file ends).
+    stream = _open_csv_text(csv_file)
+    try:
+        reader = csv.DictReader(stream)
+        missing = [col for col in KEYWORD_CSV_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+
+        current = None
+        for row in reader:
+            url = (row["url"] or "").strip()
+            prim = (row["primary kw"] or "").strip()
+            sec = (row["secundary kw"] or "").strip()
+
+            if url:
+                if current:
+                    yield current
+                current = (url, prim, [sec] if sec else [])
+            elif current and sec:
+                current[2].append(sec)
+        if current:
+            yield current
+    finally:
+        if isinstance(csv_file, (str, os.PathLike)):
+            stream.close()
+        elif isinstance(stream, io.TextIOWrapper) and stream is not csv_file:
+            stream.detach()  # leave the caller's binary file open
+
+
 def parse_keywords_csv(csv_file) -> dict[str, dict[str, any]]:
-    df = pd.read_csv(csv_file, dtype=str).fillna("")
     grouped: dict[str, dict[str, any]] = {}
-    current_url = None
-
-    for _, row in df.iterrows():
-        url = row["url"].strip()
-        prim = row["primary kw"].strip()
-        sec = row["secundary kw"].strip()
-
-        if url:
-            current_url = url
-            grouped[current_url] = {
-                "primary_kw": prim,
-                "secondary_kw": []
-            }
-            if sec:
-                grouped[current_url]["secondary_kw"].append(sec)
+    for url, prim, secondaries in iter_keyword_groups(csv_file):
+        grouped[url] = {
+            "primary_kw": prim,
+            "secondary_kw": secondaries
+        }
+    return grouped
+
+
+# -----------------------------------------------------------------------------
+# SECTION 2B: CONCURRENT CRAWLER
+# -----------------------------------------------------------------------------
+
+class Crawler:
+    # Thread-pool fetch stage with a global worker cap, a per-host cap and one
+    # pooled HttpClient shared by every worker for connection reuse.
+    # Dispatch is host-aware: a URL is only handed to a worker once its host
+    # has a free slot and a token in the shared HostScheduler, so a throttled
+    # host never ties up workers that other hosts could use. A 429 doesn't
+    # wait in the worker either: the host is backed off and the URL goes back
+    # to the front of its host queue, up to max_retries times.
+    def __init__(self, max_workers: int = 8, per_host: int = 2, http: HttpClient | None = None,
+                 scheduler: HostScheduler | None = None, worker_init=None, max_retries: int = 3):
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max(1, max_retries)
+        # runs once in each worker thread, e.g. to attach the Streamlit context
+        self.worker_init = worker_init
+        self.per_host = max(1, per_host)
+        self.http = http or HttpClient(pool_size=self.max_workers)
+        self.scheduler = scheduler or HostScheduler()
+
+    def fetch(self, url: str, throttle_attempt: int = 0) -> ParsedPage | None:
+        with INSTRUMENTS.page(url):
+            return extract_main_content(url, self.max_retries, session=self.http, scheduler=self.scheduler,
+                                        throttle_attempt=throttle_attempt)
+
+    def fetch_body(self, url: str, throttle_attempt: int = 0) -> tuple[bytes, str] | None:
+        # the undecoded body and its sniffed encoding, for clean_html() in a
+        # worker process
+        with INSTRUMENTS.page(url):
+            resp = fetch_response(url, self.max_retries, session=self.http, scheduler=self.scheduler,
+                                  throttle_attempt=throttle_attempt)
+            return (resp.content, resp.encoding) if resp is not None else None
+
+    def crawl(self, urls: Iterable[str], raw: bool = False
+              ) -> Iterator[tuple[str, ParsedPage | tuple[bytes, str] | None]]:
+        # Yields (url, parsed page) in completion order, or (url, (body,
+        # encoding)) with raw=True. URLs are read ahead lazily (a bounded
+        # window per run), so huge URL lists are never materialized.
+        fetch = self.fetch_body if raw else self.fetch
+        url_iter = iter(urls)
+        lookahead = self.max_workers * 8
+        queued: dict[str, deque[str]] = {}
+        queued_count = 0
+        host_busy: dict[str, int] = {}
+        throttled: dict[str, int] = {}
+        in_flight = {}
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.worker_init) as pool:
+            while True:
+                while not exhausted and queued_count < lookahead:
+                    url = next(url_iter, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    queued.setdefault(urlparse(url).netloc, deque()).append(url)
+                    queued_count += 1
+
+                next_ready = None
+                for host, host_queue in list(queued.items()):
+                    if len(in_flight) >= self.max_workers:
+                        break
+                    while host_queue and host_busy.get(host, 0) < self.per_host:
+                        delay = self.scheduler.delay(host_queue[0])
+                        if delay > 0:
+                            next_ready = delay if next_ready is None else min(next_ready, delay)
+                            break
+                        url = host_queue.popleft()
+                        queued_count -= 1
+                        host_busy[host] = host_busy.get(host, 0) + 1
+                        in_flight[pool.submit(fetch, url, throttled.get(url, 0))] = url
+                        if len(in_flight) >= self.max_workers:
+                            break
+                    if not host_queue:
+                        del queued[host]
+
+                if not in_flight:
+                    if not queued and exhausted:
+                        return
+                    time.sleep(next_ready or 0.05)
+                    continue
+
+                done, _ = wait(in_flight, timeout=next_ready, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    host = urlparse(url).netloc
+                    host_busy[host] -= 1
+                    try:
+                        page = future.result()
+                    except HostThrottled:
+                        attempts = throttled[url] = throttled.get(url, 0) + 1
+                        if attempts < self.max_retries:
+                            # dispatch holds it until scheduler.delay() clears
+                            queued.setdefault(host, deque()).appendleft(url)
+                            queued_count += 1
+                            continue
+                        logger.warning(f"❌ Failed to fetch {url} after {attempts} attempts.")
+                        page = None
+                    throttled.pop(url, None)
+                    yield url, page
+
+
+# -----------------------------------------------------------------------------
+# SECTION 2C: SITE LINK GRAPH
+# -----------------------------------------------------------------------------
+
+@lru_cache(maxsize=1 << 17)
+def _resolve_link(base: str, href: str) -> tuple[str, str] | None:
+    url, _fragment = urldefrag(urljoin(base, href))
+    parts = urlparse(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+        return None
+    netloc = parts.netloc.lower()
+    return parts._replace(scheme=parts.scheme.lower(), netloc=netloc, path=parts.path or "/").geturl(), netloc
+
+
+def normalize_link(base: str, href: str) -> str | None:
+    # absolute http(s) URL without fragment, lowercase scheme/host, "/" path
+    # for bare hosts; None for mailto:, javascript: and the like
+    resolved = _resolve_link(base, href.strip())
+    return resolved[0] if resolved else None
+
+
+def site_root(url: str) -> str:
+    parts = urlparse(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}/"
+
+
+class LinkGraph:
+    # Internal links between crawled pages. URLs get dense integer IDs and the
+    # edges live in two flat array('I') columns (source, target), so a
+    # 100k-page site with millions of links costs a few bytes per edge on top
+    # of the URL strings themselves. Each node is uncrawled (0), crawled (1)
+    # or broken (2): linked, but its fetch failed.
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self.urls: list[str] = []
+        self._crawled = bytearray()
+        self._src = array("I")
+        self._dst = array("I")
+        self._lock = threading.Lock()
+
+    def _node(self, url: str) -> int:
+        node = self._ids.get(url)
+        if node is None:
+            node = self._ids[url] = len(self.urls)
+            self.urls.append(url)
+            self._crawled.append(0)
+        return node
+
+    def add_page(self, url: str, hrefs: Iterable[str]) -> None:
+        # Records a crawled page and its same-host links (each target once,
+        # self-links dropped). A page already recorded is ignored.
+        page_url = normalize_link(url, "") or url
+        host = urlparse(page_url).netloc
+        origin = site_root(page_url)
+        targets = set()
+        for href in hrefs:
+            href = href.strip()
+            # site-wide navigation repeats on every page: resolve root-relative
+            # and absolute links against the origin so the memo catches them
+            shared = href.startswith(("http:", "https:")) or (href.startswith("/") and not href.startswith("//"))
+            resolved = _resolve_link(origin if shared else page_url, href)
+            if resolved and resolved[1] == host and resolved[0] != page_url:
+                targets.add(resolved[0])
+        with self._lock:
+            source = self._node(page_url)
+            if self._crawled[source]:
+                return
+            self._crawled[source] = 1
+            for link in targets:
+                self._src.append(source)
+                self._dst.append(self._node(link))
+
+    def add_broken(self, url: str) -> None:
+        # a page whose fetch failed: reported, never followed again, and not
+        # counted as crawled
+        with self._lock:
+            node = self._node(normalize_link(url, "") or url)
+            if not self._crawled[node]:
+                self._crawled[node] = 2
+
+    def add_url(self, url: str) -> None:
+        # known but not (yet) crawled, e.g. a home page to follow from
+        with self._lock:
+            self._node(normalize_link(url, "") or url)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._src)
+
+    @property
+    def crawled_count(self) -> int:
+        return self._crawled.count(1)
+
+    @property
+    def broken_count(self) -> int:
+        return self._crawled.count(2)
+
+    def frontier(self) -> list[str]:
+        # linked (or added) but not crawled yet, in discovery order
+        with self._lock:
+            return [url for url, crawled in zip(self.urls, self._crawled) if not crawled]
+
+    def report(self, roots: Iterable[str] | None = None) -> Iterator[tuple[str, dict[str, any]]]:
+        # (url, {"inbound", "outbound", "depth", "orphan", "broken"}) per
+        # crawled or broken page. depth is clicks from the nearest root
+        # (default: each host's home page), None if unreachable through crawled
+        # pages. An orphan is a page no crawled page links to (roots excepted).
+        with self._lock:
+            n = len(self.urls)
+            src, dst, crawled = self._src, self._dst, bytes(self._crawled)
+            if roots is None:
+                roots = {site_root(url) for url, seen in zip(self.urls, crawled) if seen == 1}
+            root_ids = [self._ids[r] for r in (normalize_link(r, "") or r for r in roots) if r in self._ids]
+            urls = list(self.urls)
+
+        inbound = array("I", bytes(4 * n))
+        offsets = array("I", bytes(4 * (n + 1)))
+        for s, d in zip(src, dst):
+            inbound[d] += 1
+            offsets[s + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        # CSR adjacency: targets[offsets[i]:offsets[i + 1]] are i's links
+        targets = array("I", bytes(4 * len(dst)))
+        cursor = array("I", offsets)
+        for s, d in zip(src, dst):
+            targets[cursor[s]] = d
+            cursor[s] += 1
+        del cursor
+
+        depth = array("i", [-1]) * n
+        bfs = deque()
+        for r in root_ids:
+            if depth[r] < 0:
+                depth[r] = 0
+                bfs.append(r)
+        while bfs:
+            node = bfs.popleft()
+            for d in targets[offsets[node]:offsets[node + 1]]:
+                if depth[d] < 0:
+                    depth[d] = depth[node] + 1
+                    bfs.append(d)
+
+        root_set = set(root_ids)
+        for i in range(n):
+            if crawled[i]:
+                yield urls[i], {
+                    "inbound": inbound[i],
+                    "outbound": offsets[i + 1] - offsets[i],
+                    "depth": depth[i] if depth[i] >= 0 else None,
+                    "orphan": inbound[i] == 0 and i not in root_set,
+                    "broken": crawled[i] == 2,
+                }
+
+
+def page_links(doc: ParsedPage) -> list[str]:
+    return [href for href, _text in PageIndex(doc, ["a"]).links]
+
+
+def expand_link_graph(graph: LinkGraph, crawler: Crawler | None = None, max_depth: int = 1,
+                      max_pages: int = 10_000, roots: Iterable[str] | None = None) -> LinkGraph:
+    # Follows links breadth-first from the pages already in the graph (plus
+    # each host's home page), max_depth clicks out, until max_pages pages
+    # have been crawled. These pages only feed the graph; they are not audited.
+    crawler = crawler or Crawler()
+    for root in roots if roots is not None else {site_root(url) for url in graph.urls}:
+        graph.add_url(root)
+    for _ in range(max_depth):
+        budget = max_pages - graph.crawled_count
+        frontier = graph.frontier()[:max(0, budget)]
+        if not frontier:
+            break
+        logger.info(f"🔗 Following {len(frontier)} internal link(s)…")
+        for url, doc in crawler.crawl(frontier):
+            if doc is None:
+                graph.add_broken(url)
+            else:
+                graph.add_page(url, page_links(doc))
+    return graph
+
+
+# -----------------------------------------------------------------------------
+# SECTION 2D: SITEMAP DISCOVERY
+# -----------------------------------------------------------------------------
+
+# Sitemaps and sitemap indexes (plain or gzipped) are parsed incrementally as
+# the body streams in, and each <url> element is dropped once read, so a
+# 50k-URL sitemap never exists as one tree. SITEMAP_MAX_BYTES caps one file's
+# decompressed size (the protocol allows 50 MB); MAX_SITEMAPS caps how many
+# files one discovery run reads through nested indexes.
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", 64 * 1024 * 1024))
+MAX_SITEMAPS = int(os.getenv("MAX_SITEMAPS", 1000))
+
+
+def parse_lastmod(value: str | None) -> datetime | None:
+    # W3C datetime ("2024-05-01", "2024-05-01T10:00:00+02:00", "...Z") as an
+    # aware datetime, UTC when no offset is given; None if missing or invalid
+    if not value:
+        return None
+    try:
+        stamp = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return stamp if stamp.tzinfo else stamp.replace(tzinfo=timezone.utc)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # inflates in pieces of at most FETCH_CHUNK_BYTES, however well it compresses
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            yield inflate.decompress(chunk, FETCH_CHUNK_BYTES)
+            chunk = inflate.unconsumed_tail
+    yield inflate.flush()
+
+
+def iter_sitemap_entries(chunks: Iterable[bytes], max_bytes: int = SITEMAP_MAX_BYTES) -> Iterator[tuple[str, str, datetime | None]]:
+    # (kind, loc, lastmod) for each entry of one sitemap file, fed as byte
+    # chunks; kind is "url" (a page) or "sitemap" (a nested sitemap).
+    # Gzipped files are recognized by their magic bytes.
+    chunks = iter(chunks)
+    first = next((chunk for chunk in chunks if chunk), b"")
+    chunks = chain([first], chunks)
+    if first[:2] == b"\x1f\x8b":
+        chunks = _gunzip(chunks)
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise ValueError(f"larger than {max_bytes:,} bytes")
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if root is None:
+                root = elem
+            if event != "end" or _local_name(elem.tag) not in ("url", "sitemap"):
+                continue
+            loc, lastmod = "", None
+            for child in elem:
+                name = _local_name(child.tag)
+                if name == "loc":
+                    loc = (child.text or "").strip()
+                elif name == "lastmod":
+                    lastmod = parse_lastmod(child.text)
+            if loc:
+                yield _local_name(elem.tag), loc, lastmod
+            root.clear()  # entries are siblings: nothing after this one is parsed yet
+    parser.close()
+
+
+def _get_sitemap_file(url: str, http: HttpClient, scheduler: HostScheduler | None = None,
+                      max_retries: int = 3, backoff_factor: int = 2) -> requests.Response:
+    # Streamed GET for robots.txt and sitemap files with the same 429 handling
+    # as page fetches: Retry-After (else exponential) backs off the whole host
+    # through the scheduler, then the request is retried. The caller closes
+    # the response; after max_retries 429s the last one is raised.
+    wait = 1
+    for attempt in range(1, max_retries + 1):
+        if scheduler is not None:
+            with INSTRUMENTS.timed("throttle"):
+                scheduler.acquire(url)
+        resp = http.session.get(url, timeout=http.timeout, stream=True)
+        INSTRUMENTS.count("http_requests")
+        if resp.status_code != 429 or attempt == max_retries:
+            return resp
+        INSTRUMENTS.count("http_429")
+        resp.close()
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        if retry_after is not None:
+            wait = retry_after
+        logger.warning(f"⚠️ Received 429 for {url}. Waiting {wait:g}s before retrying… (Attempt {attempt})")
+        if scheduler is not None:
+            scheduler.backoff(url, wait)
+        else:
+            with INSTRUMENTS.timed("backoff"):
+                time.sleep(wait)
+        wait *= backoff_factor
+    return resp
+
+
+def discover_sitemaps(site: str, http: HttpClient, scheduler: HostScheduler | None = None) -> list[str]:
+    # the Sitemap: lines of the site's robots.txt, else /sitemap.xml
+    robots_url = urljoin(site_root(site), "/robots.txt")
+    try:
+        with _get_sitemap_file(robots_url, http, scheduler) as resp:
+            ok = resp.status_code == 200
+            text = resp.text if ok else ""
+        if ok:
+            found = [line.split(":", 1)[1].strip() for line in text.splitlines()
+                     if line.lower().startswith("sitemap:")]
+            if found:
+                return found
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"⚠️ Could not read {robots_url}: {e}")
+    return [urljoin(site_root(site), "/sitemap.xml")]
+
+
+def iter_sitemap_pages(sources: Iterable[str], http: HttpClient | None = None,
+                       scheduler: HostScheduler | None = None,
+                       max_sitemaps: int = MAX_SITEMAPS) -> Iterator[tuple[str, datetime | None]]:
+    # (page url, lastmod) for every page listed in the given sitemaps, each
+    # once. A source that is a bare site ("https://example.com/") is looked
+    # up in its robots.txt; sitemap indexes are followed breadth-first. A
+    # sitemap that can't be fetched or parsed is logged and skipped.
+    http = http or HttpClient(pool_size=1, cache_path=None)
+    pending: deque[str] = deque()
+    for source in sources:
+        if urlparse(source).path in ("", "/"):
+            pending.extend(discover_sitemaps(source, http, scheduler))
         else:
-            if current_url and sec:
-                grouped[current_url]["secondary_kw"].append(sec)
+            pending.append(source)
+    read_maps: set[str] = set()
+    seen_pages: set[str] = set()
+    while pending and len(read_maps) < max_sitemaps:
+        sitemap_url = pending.popleft()
+        if sitemap_url in read_maps:
+            continue
+        read_maps.add(sitemap_url)
+        pages = nested = 0
+        try:
+            resp = _get_sitemap_file(sitemap_url, http, scheduler)
+            try:
+                resp.raise_for_status()
+                # iter_content undoes Content-Encoding; .xml.gz files are gunzipped by the parser
+                for kind, loc, lastmod in iter_sitemap_entries(resp.iter_content(FETCH_CHUNK_BYTES)):
+                    if kind == "sitemap":
+                        nested += 1
+                        pending.append(loc)
+                    elif loc not in seen_pages:
+                        pages += 1
+                        seen_pages.add(loc)
+                        yield loc, lastmod
+            finally:
+                resp.close()
+        except (requests.exceptions.RequestException, ElementTree.ParseError, ValueError, OSError) as e:
+            logger.warning(f"⚠️ Could not read sitemap {sitemap_url}: {e}")
+            INSTRUMENTS.count("sitemap_errors")
+            continue
+        INSTRUMENTS.count("sitemaps_read")
+        logger.info(f"🗺️ {sitemap_url}: {pages} page(s), {nested} nested sitemap(s)")
+    if pending:
+        logger.warning(f"⚠️ Stopped after {max_sitemaps} sitemaps; {len(pending)} more were not read.")
+
+
+def join_keywords(pages: Iterable[tuple[str, datetime | None]], keywords_dict: dict[str, dict[str, any]]
+                  ) -> Iterator[tuple[str, datetime | None, dict[str, any]]]:
+    # (url, lastmod, keywords) per sitemap page, matched to keywords_dict on
+    # the normalized URL (the keywords_dict spelling wins; {} if the page has
+    # no keywords), then the keywords_dict URLs no sitemap listed.
+    by_link = {normalize_link(url, "") or url: url for url in keywords_dict}
+    for page, lastmod in pages:
+        url = by_link.pop(normalize_link(page, "") or page, page)
+        yield url, lastmod, keywords_dict.get(url, {})
+    for url in by_link.values():
+        yield url, None, keywords_dict[url]
+
+
+def sitemap_page_changed(lastmod: datetime | None, since: datetime | None = None,
+                         audited_at: float | None = None) -> bool:
+    # Worth (re)auditing: modified after `since` and after the page's last
+    # stored audit (epoch seconds). Pages without a lastmod always are.
+    if lastmod is None:
+        return True
+    if since is not None and lastmod <= since:
+        return False
+    return audited_at is None or lastmod.timestamp() > audited_at
 
-    return grouped
+
+# -----------------------------------------------------------------------------
+# SECTION 2E: OFFLINE PAGE SOURCES
+# -----------------------------------------------------------------------------
+
+class PageSource(abc.ABC):
+    # Offline stand-in for Crawler: pages come from saved copies instead of
+    # HTTP. Subclasses map URLs to stored bodies; crawl() has Crawler's
+    # signature, so iter_page_metrics(), analyze_kws_from_csv() and
+    # expand_link_graph() take either, and re-scoring an archive is bound by
+    # parsing (use processes=N), not by the network.
+    worker_init = None
+
+    @abc.abstractmethod
+    def urls(self) -> Iterator[str]:
+        # every page the source holds
+        ...
+
+    @abc.abstractmethod
+    def body(self, url: str) -> tuple[bytes, str] | None:
+        # (raw body, Content-Type) of the stored page, None if it isn't stored
+        ...
+
+    def _read(self, url: str) -> tuple[bytes, str] | None:
+        found = self.body(url)
+        if found is None:
+            logger.warning(f"❌ {url} is not in the archive. Skipping.")
+            INSTRUMENTS.count("pages_missing")
+            return None
+        data, content_type = found
+        if len(data) > MAX_PAGE_BYTES:
+            data = data[:MAX_PAGE_BYTES]
+            INSTRUMENTS.count("pages_truncated")
+        return data, sniff_encoding(content_type, data[:FETCH_CHUNK_BYTES])
+
+    def fetch(self, url: str) -> ParsedPage | None:
+        with INSTRUMENTS.page(url):
+            found = self._read(url)
+            if found is None:
+                return None
+            with INSTRUMENTS.timed("parse"):
+                return clean_html(found[0], encoding=found[1])
+
+    def fetch_body(self, url: str) -> tuple[bytes, str] | None:
+        return self._read(url)
+
+    def crawl(self, urls: Iterable[str], raw: bool = False
+              ) -> Iterator[tuple[str, ParsedPage | tuple[bytes, str] | None]]:
+        fetch = self.fetch_body if raw else self.fetch
+        for url in urls:
+            yield url, fetch(url)
+
+    def close(self) -> None:
+        pass
+
+
+class HtmlDirSource(PageSource):
+    # Saved .html/.htm files under root, laid out like a wget mirror
+    # (root/example.com/blog/post.html -> https://example.com/blog/post.html,
+    # .../index.html -> .../), or named relative to base_url when given. A
+    # root that is a single file is the page at base_url.
+    def __init__(self, root: str, base_url: str | None = None):
+        self.root = root
+        self.base_url = base_url
+        self._paths: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    def _url_for(self, rel_path: str) -> str:
+        if rel_path == "index.html" or rel_path.endswith("/index.html"):
+            rel_path = rel_path[:-len("index.html")]
+        url = urljoin(self.base_url, rel_path) if self.base_url else "https://" + rel_path
+        return normalize_link(url, "") or url
+
+    def _index(self) -> dict[str, str]:
+        with self._lock:
+            if self._paths is None:
+                paths = {}
+                if os.path.isfile(self.root):
+                    paths[normalize_link(self.base_url, "") or self.base_url] = self.root
+                for folder, dirs, files in os.walk(self.root):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if name.lower().endswith((".html", ".htm")):
+                            path = os.path.join(folder, name)
+                            rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                            paths[self._url_for(rel_path)] = path
+                self._paths = paths
+            return self._paths
+
+    def urls(self) -> Iterator[str]:
+        return iter(list(self._index()))
+
+    def body(self, url: str) -> tuple[bytes, str] | None:
+        path = self._index().get(normalize_link(url, "") or url)
+        if path is None:
+            return None
+        with open(path, "rb") as fh:
+            return fh.read(), "text/html"
+
+
+def _split_http_head(block: bytes) -> tuple[int, dict[str, str], int]:
+    # (status, lowercase headers, body offset) of an HTTP response block
+    end = block.find(b"\r\n\r\n")
+    end = len(block) if end < 0 else end
+    lines = block[:end].decode("iso-8859-1").split("\r\n")
+    try:
+        status = int(lines[0].split(None, 2)[1])
+    except (IndexError, ValueError):
+        status = 0
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, end + 4
+
+
+def _dechunk(data: bytes) -> bytes:
+    # Transfer-Encoding: chunked, as stored by most WARC writers
+    out = bytearray()
+    pos = 0
+    while True:
+        eol = data.find(b"\r\n", pos)
+        if eol < 0:
+            break
+        try:
+            size = int(data[pos:eol].split(b";", 1)[0], 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        out += data[eol + 2:eol + 2 + size]
+        pos = eol + 2 + size + 2
+    return bytes(out)
+
+
+def _decode_content(data: bytes, coding: str) -> bytes:
+    if coding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+    if coding == "deflate":
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return zlib.decompress(data, -zlib.MAX_WBITS)  # raw deflate, no zlib header
+    if coding == "br":
+        if brotli is None:
+            raise ValueError("brotli is not installed")
+        return brotli.decompress(data)
+    return data
+
+
+class WarcSource(PageSource):
+    # HTML pages in WARC files (.warc, or .warc.gz with one gzip member per
+    # record). Files are memory-mapped and indexed on first use: per URL, where
+    # its last HTML 200 response (or resource) record sits. A record is only
+    # sliced out, de-chunked and decompressed when its page is read.
+    def __init__(self, paths: Iterable[str]):
+        self.paths = list(paths)
+        self._maps: list[mmap.mmap | None] = []
+        # url -> (file no., record offset, gzipped, block offset, block length, WARC type)
+        self._records: dict[str, tuple[int, int, bool, int, int, str]] | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _gzip_member(view: memoryview, offset: int, keep: int | None) -> tuple[bytes, int]:
+        # the first `keep` inflated bytes (all with None) of the gzip member at
+        # offset, and where the next member starts
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = bytearray()
+        pos = offset
+        while not inflate.eof:
+            chunk = view[pos:pos + FETCH_CHUNK_BYTES]
+            if not chunk:
+                raise ValueError(f"truncated gzip member at offset {offset}")
+            pos += len(chunk)
+            data = inflate.decompress(chunk)
+            if keep is None or len(out) < keep:
+                out += data
+        return bytes(out if keep is None else out[:keep]), pos - len(inflate.unused_data)
+
+    @staticmethod
+    def _warc_head(data, pos: int) -> tuple[dict[str, str], int]:
+        # WARC headers of the record at pos, and where its block starts
+        end = data.find(b"\r\n\r\n", pos)
+        if end < 0 or bytes(data[pos:pos + 5]) != b"WARC/":
+            raise ValueError(f"no WARC record at offset {pos}")
+        headers = {}
+        for line in bytes(data[pos:end]).decode("utf-8", "replace").split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return headers, end + 4
+
+    def _iter_records(self, mm: mmap.mmap) -> Iterator[tuple[int, bool, dict[str, str], int, bytes]]:
+        # (record offset, gzipped, WARC headers, block offset, first block bytes)
+        view = memoryview(mm)
+        gzipped = mm[:2] == b"\x1f\x8b"
+        pos = 0
+        while pos < len(mm):
+            if gzipped:
+                record, next_pos = self._gzip_member(view, pos, keep=FETCH_CHUNK_BYTES)
+                headers, block = self._warc_head(record, 0)
+                yield pos, True, headers, block, record[block:]
+                pos = next_pos
+            else:
+                headers, block = self._warc_head(mm, pos)
+                length = int(headers.get("content-length", 0))
+                yield pos, False, headers, block, mm[block:block + min(length, FETCH_CHUNK_BYTES)]
+                pos = block + length
+                while mm[pos:pos + 2] == b"\r\n":
+                    pos += 2
+
+    def _index(self) -> dict[str, tuple[int, int, bool, int, int, str]]:
+        with self._lock:
+            if self._records is not None:
+                return self._records
+            records = {}
+            for file_no, path in enumerate(self.paths):
+                if not os.path.getsize(path):
+                    self._maps.append(None)
+                    continue
+                with open(path, "rb") as fh:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mm)
+                count = 0
+                try:
+                    for offset, gzipped, headers, block, head in self._iter_records(mm):
+                        kind = headers.get("warc-type", "")
+                        uri = headers.get("warc-target-uri", "").strip("<>")
+                        if kind == "response":
+                            status, http_headers, _ = _split_http_head(head)
+                            content_type = http_headers.get("content-type", "")
+                        elif kind == "resource":
+                            status, content_type = 200, headers.get("content-type", "")
+                        else:
+                            continue
+                        mime = content_type.split(";", 1)[0].strip().lower()
+                        if status != 200 or (mime and mime not in HTML_CONTENT_TYPES) or not uri:
+                            continue
+                        records[normalize_link(uri, "") or uri] = (
+                            file_no, offset, gzipped, block, int(headers.get("content-length", 0)), kind)
+                        count += 1
+                except ValueError as e:
+                    logger.warning(f"⚠️ Stopped reading {path}: {e}")
+                logger.info(f"📦 {path}: {count} HTML page(s)")
+            self._records = records
+            return records
+
+    def urls(self) -> Iterator[str]:
+        return iter(list(self._index()))
+
+    def body(self, url: str) -> tuple[bytes, str] | None:
+        entry = self._index().get(normalize_link(url, "") or url)
+        if entry is None:
+            return None
+        file_no, offset, gzipped, block, length, kind = entry
+        mm = self._maps[file_no]
+        if gzipped:
+            record, _ = self._gzip_member(memoryview(mm), offset, keep=None)
+            data = record[block:block + length]
+        else:
+            data = mm[block:block + length]
+        if kind == "resource":
+            return data, ""
+        _status, headers, body_at = _split_http_head(data)
+        data = data[body_at:]
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            data = _dechunk(data)
+        coding = headers.get("content-encoding", "").strip().lower()
+        try:
+            data = _decode_content(data, coding)
+        except Exception as e:  # zlib.error, brotli.error, or no brotli
+            logger.warning(f"⚠️ Could not decode {url} ({coding}): {e}")
+            return None
+        return data, headers.get("content-type", "")
+
+    def close(self) -> None:
+        with self._lock:
+            for mm in self._maps:
+                if mm is not None:
+                    mm.close()
+            self._maps = []
+            self._records = None
+
+
+def open_page_source(path: str, base_url: str | None = None) -> PageSource:
+    # a WARC file, a directory of WARC files, a directory of saved HTML, or
+    # one saved HTML file (its URL given as base_url)
+    if os.path.isdir(path):
+        warcs = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if name.endswith((".warc", ".warc.gz")))
+        return WarcSource(warcs) if warcs else HtmlDirSource(path, base_url)
+    if path.lower().endswith((".html", ".htm")):
+        if not base_url:
+            raise ValueError(f"{path} is a single HTML file: give the page's URL as the base URL")
+        return HtmlDirSource(path, base_url)
+    if not path.endswith((".warc", ".warc.gz")):
+        raise ValueError(f"{path} is not a WARC file (.warc, .warc.gz), an HTML file or a directory")
+    return WarcSource([path])
 
 
 # -----------------------------------------------------------------------------
@@ -293,327 +2482,835 @@ LANGUAGE_MAP = {
     "es": "Spanish"
 }
 
-def analyze_kws_from_csv(urls: list[str], keywords_dict: dict[str, dict[str, any]], client: openai.Client) -> dict[str, dict[str, any]]:
-    results: dict[str, dict[str, any]] = {}
+# Language of pages without <html lang>. Only the first LANG_SAMPLE_CHARS of
+# body text are classified, by a seeded detector so reruns agree, and a
+# result at or above LANG_MIN_CONFIDENCE becomes the host's language: the
+# site's other unlabeled pages reuse it without running detection again.
+LANG_SAMPLE_CHARS = int(os.getenv("LANG_SAMPLE_CHARS", 2000))
+LANG_MIN_CONFIDENCE = float(os.getenv("LANG_MIN_CONFIDENCE", 0.9))
+LANG_MIN_SAMPLE_CHARS = 100
+DEFAULT_LANG = "en"
+DetectorFactory.seed = 0
+
+
+def detect_language(text: str, sample_chars: int = LANG_SAMPLE_CHARS) -> tuple[str, float]:
+    # (language code, probability) for a bounded sample of the text. Very
+    # short texts get confident but unreliable guesses: reported as 0.0.
+    sample = text[:sample_chars].strip()
+    if not sample:
+        return DEFAULT_LANG, 0.0
+    try:
+        best = detect_langs(sample)[0]
+    except LangDetectException:
+        return DEFAULT_LANG, 0.0
+    return best.lang.split("-")[0], best.prob if len(sample) >= LANG_MIN_SAMPLE_CHARS else 0.0
+
+
+class HostLanguages:
+    # host -> language code of its confidently detected pages, LRU-bounded.
+    # Declared <html lang> values are per page and never cached. One per run
+    # (iter_page_metrics() makes its own), so no run depends on an earlier one.
+    def __init__(self, max_hosts: int = 10_000, min_confidence: float = LANG_MIN_CONFIDENCE):
+        self.max_hosts = max_hosts
+        self.min_confidence = min_confidence
+        self._hosts: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> str | None:
+        with self._lock:
+            if host in self._hosts:
+                self._hosts.move_to_end(host)
+            return self._hosts.get(host)
+
+    def put(self, host: str, lang: str, confidence: float = 1.0) -> None:
+        if confidence < self.min_confidence:
+            return
+        with self._lock:
+            self._hosts[host] = lang
+            self._hosts.move_to_end(host)
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+
+
+def page_language(url: str, index: PageIndex, hosts: HostLanguages | None = None) -> str:
+    # the declared <html lang>, else the host's detected language from this
+    # run, else detection on a sample of the page (no caching without hosts)
+    hosts = HostLanguages() if hosts is None else hosts
+    host = urlparse(url).netloc
+    if index.lang:
+        lang_code = index.lang.split('-')[0].split('_')[0].strip().lower()
+        if lang_code:
+            return lang_code
+    known = hosts.get(host)
+    if known is not None:
+        INSTRUMENTS.count("lang_host_hits")
+        return known
+    with INSTRUMENTS.timed("langid"):
+        lang_code, confidence = detect_language(index.full_text)
+    hosts.put(host, lang_code, confidence)
+    return lang_code
+
+# Bump whenever a check, recommendation text, LLM prompt or anything else that
+# changes a verdict for the same page changes (sentence splitting, language
+# handling, ...), so stored results from older rules are not reused.
+RULESET_VERSION = "4"
+
+# Set to a file path to reuse stored metrics for pages whose cleaned content
+# and keywords haven't changed since the last audit.
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH")
+
+
+def page_fingerprint(index: PageIndex, info: dict[str, any], matcher_name: str = "",
+                     rule_names: list[str] | None = None, lang: str = "") -> str:
+    # hash of the cleaned page (whitespace-normalized) plus everything else
+    # that feeds the metrics: keywords, rule version and set, matcher backend
+    # and the page language (the host cache can change it for the same HTML)
+    digest = hashlib.sha256()
+    digest.update(" ".join(index.html.split()).encode("utf-8"))
+    digest.update(json.dumps({
+        "primary_kw": info.get("primary_kw", ""),
+        "secondary_kw": info.get("secondary_kw", []),
+        "ruleset": RULESET_VERSION,
+        "matcher": matcher_name,
+        "rules": rule_names,
+        "lang": lang,
+    }, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultStore:
+    # SQLite store of url -> (fingerprint, metrics) from previous audits
+    def __init__(self, path: str):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " url TEXT PRIMARY KEY, fingerprint TEXT, metrics TEXT, stored_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str, fingerprint: str) -> dict[str, any] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT metrics FROM results WHERE url = ? AND fingerprint = ?", (url, fingerprint)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def audited_at(self, url: str) -> float | None:
+        # when the stored metrics for url were computed (epoch seconds)
+        with self._lock:
+            row = self._db.execute("SELECT stored_at FROM results WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, url: str) -> None:
+        # the stored metrics were just confirmed current (same fingerprint), so
+        # --changed-only compares later lastmods against now
+        with self._lock:
+            self._db.execute("UPDATE results SET stored_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+
+    def put(self, url: str, fingerprint: str, metrics: dict[str, any]) -> None:
+        payload = json.dumps(metrics, ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (url, fingerprint, payload, time.time())
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# Rule registry. Every check is a function (ctx) -> (recommendation, example)
+# registered under its report name; registration order is report order.
+# `needs` names the PageIndex parts a rule reads (see INDEX_NEEDS), so pages
+# are only indexed for what the enabled rules use. `cost` is "local" (the
+# parsed page only), "network" (extra requests) or "llm" (keyword matching).
+RULE_COSTS = ("local", "network", "llm")
+
+INDEX_NEEDS = {
+    "lang": ("html",),
+    "title": ("title",),
+    "meta": ("meta",),
+    "headings": HEADING_LEVELS,
+    "paragraphs": ("p",),
+    "lists": ("ul", "ol"),
+    "bold": ("b", "strong"),
+    "images": ("img",),
+    "links": ("a",),
+    "text": (),
+}
 
-    for url in urls:
-        info = keywords_dict.get(url, {})
-        primary = info.get("primary_kw", "")
-        secondaries = info.get("secondary_kw", [])
+# Which costs each profile allows. Pick one with RULE_PROFILE (or --profile);
+# RULES_DISABLED is a comma-separated list of rule names to skip on top.
+RULE_PROFILES = {
+    "full": RULE_COSTS,
+    "no-llm": ("local", "network"),
+    "local": ("local",),
+}
+RULE_PROFILE = os.getenv("RULE_PROFILE", "full")
+RULES_DISABLED = [name.strip() for name in os.getenv("RULES_DISABLED", "").split(",") if name.strip()]
+
+# Page texts the keyword matcher needs, by keyword input name
+KEYWORD_INPUTS = {
+    "title": ("title", meta_title_show),
+    "description": ("meta", meta_description),
+    "h1": ("headings", h1_show),
+    "image_alts": ("images", show_images_text),
+    "body": ("text", lambda index: index.full_text),
+}
 
-        content_soup = extract_main_content(url)
-        if content_soup is None:
-            results[url] = {"error": "Could not fetch page (HTTP error or 429) – skipped analysis"}
-            continue
 
-        full_text = content_soup.get_text(strip=True)
+class Rule:
+    def __init__(self, name: str, check, needs: tuple[str, ...] = (), cost: str = "local",
+                 keyword_input: str | None = None):
+        if cost not in RULE_COSTS:
+            raise ValueError(f"Unknown rule cost: {cost!r} (expected one of {RULE_COSTS})")
+        unknown = set(needs) - INDEX_NEEDS.keys()
+        if unknown:
+            raise ValueError(f"Rule {name!r} needs unknown index parts: {sorted(unknown)}")
+        self.name = name
+        self.check = check
+        self.needs = tuple(needs)
+        self.cost = cost
+        # keyword rules: which KEYWORD_INPUTS text the matcher checks for them
+        self.keyword_input = keyword_input
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}, cost={self.cost!r})"
+
+
+RULES: dict[str, Rule] = {}
+
+
+def rule(name: str, needs: tuple[str, ...] = (), cost: str = "local", keyword_input: str | None = None):
+    # Decorator registering a check. Registering an existing name replaces it
+    # in place, so custom rules can override a built-in one.
+    def register(check):
+        RULES[name] = Rule(name, check, needs, cost, keyword_input)
+        return check
+    return register
+
+
+def enabled_rules(profile: str | None = None, disabled: Iterable[str] | None = None) -> list[Rule]:
+    profile = profile or RULE_PROFILE
+    disabled = set(RULES_DISABLED if disabled is None else disabled)
+    if profile not in RULE_PROFILES:
+        raise ValueError(f"Unknown rule profile: {profile!r} (expected one of {sorted(RULE_PROFILES)})")
+    unknown = disabled - RULES.keys()
+    if unknown:
+        raise ValueError(f"Unknown rules: {sorted(unknown)}")
+    return [r for r in RULES.values() if r.cost in RULE_PROFILES[profile] and r.name not in disabled]
+
+
+def rule_index_tags(rules: Iterable[Rule]) -> list[str]:
+    # the INDEXED_TAGS the given rules read (the language is always needed)
+    needs = {"lang"}
+    for r in rules:
+        needs.update(r.needs)
+        if r.keyword_input:
+            needs.add(KEYWORD_INPUTS[r.keyword_input][0])
+    wanted = {tag for need in needs for tag in INDEX_NEEDS[need]}
+    return [tag for tag in INDEXED_TAGS if tag in wanted]
+
+
+class RuleContext:
+    # What a check sees. keyword_inputs/kw_matches are only filled for the
+    # "llm" pass, after the batched keyword match.
+    def __init__(self, url: str, index: PageIndex, info: dict[str, any],
+                 keyword_inputs: dict[str, any] | None = None, kw_matches: dict[str, bool] | None = None,
+                 lang: str = ""):
+        self.url = url
+        self.index = index
+        self.lang = lang
+        self.primary = info.get("primary_kw", "")
+        self.secondaries = info.get("secondary_kw", [])
+        self.keyword_inputs = keyword_inputs or {}
+        self.kw_matches = kw_matches or {}
+
+
+@rule("Page Title", needs=("title",))
+def check_page_title(ctx: RuleContext) -> tuple[str, str]:
+    meta_title_text = meta_title_show(ctx.index)
+    title_flag = analyze_meta_title(ctx.index)
+    if not meta_title_text:
+        return "Add a page title of ~45 characters that includes your primary keyword.", "(none found)"
+    if title_flag == 0:
+        return "Expand the page title to ~45 characters to improve SEO visibility.", meta_title_text
+    if title_flag == 1:
+        return ("Shorten the page title to ~45 characters to ensure it displays fully in search results.",
+                meta_title_text)
+    return "/", meta_title_text
+
+
+@rule("Primary KW in Title", cost="llm", keyword_input="title")
+def check_primary_in_title(ctx: RuleContext) -> tuple[str, str]:
+    meta_title_text = ctx.keyword_inputs["title"]
+    if ctx.primary and not ctx.kw_matches["title"]:
+        rec = f"Include your primary keyword (“{ctx.primary}”) in the page title for better relevance."
+        return rec, meta_title_text if meta_title_text else "(no title to show)"
+    return "/", meta_title_text if meta_title_text else ""
+
+
+@rule("Meta Description", needs=("meta",))
+def check_meta_description(ctx: RuleContext) -> tuple[str, str]:
+    meta_desc_text = meta_description(ctx.index)
+    desc_flag = analyze_meta_description(ctx.index)
+    if not meta_desc_text:
+        return ("Add a meta description of ~130 characters that summarizes the page and includes a CTA.",
+                "(none found)")
+    if desc_flag == 0:
+        return "Expand the meta description to ~130 characters to improve click-through rates.", meta_desc_text
+    if desc_flag == 1:
+        return ("Shorten the meta description to ~130 characters so it doesn’t get cut off in search results.",
+                meta_desc_text)
+    return "/", meta_desc_text
+
+
+@rule("Primary KW in Description", cost="llm", keyword_input="description")
+def check_primary_in_description(ctx: RuleContext) -> tuple[str, str]:
+    meta_desc_text = ctx.keyword_inputs["description"]
+    if ctx.primary and not ctx.kw_matches["description"]:
+        rec = f"Include your primary keyword (“{ctx.primary}”) in the meta description for better relevance."
+        return rec, meta_desc_text if meta_desc_text else ""
+    return "/", meta_desc_text if meta_desc_text else ""
+
+
+@rule("H1 Structure", needs=("headings",))
+def check_h1_structure(ctx: RuleContext) -> tuple[str, str]:
+    h1_texts = ctx.index.headings["h1"]
+    if not h1_texts:
+        return "Add exactly one <h1> tag that clearly states the page’s topic.", "(no H1 found)"
+    if len(h1_texts) > 1:
+        return "Remove extra <h1> tags so there is only one main heading.", "; ".join(h1_texts)
+    return "/", h1_texts[0]
+
+
+@rule("Primary KW in H1", cost="llm", keyword_input="h1")
+def check_primary_in_h1(ctx: RuleContext) -> tuple[str, str]:
+    h1_text = ctx.keyword_inputs["h1"]
+    if ctx.primary and not ctx.kw_matches["h1"]:
+        rec = f"Include your primary keyword (“{ctx.primary}”) in the <h1> tag to signal relevance."
+        return rec, h1_text if h1_text else ""
+    return "/", h1_text if h1_text else ""
+
+
+@rule("H3 Presence", needs=("headings",))
+def check_h3_presence(ctx: RuleContext) -> tuple[str, str]:
+    no_h3 = analyze_h3(ctx.index)
+    if no_h3 and ctx.index.headings["h2"]:
+        return "Add at least one <h3> subsection under each <h2> to improve hierarchy.", "(no H3 tags found)"
+    return "/", "(H3 present)" if not no_h3 else ""
+
+
+@rule("H5/H6 Depth", needs=("headings",))
+def check_h5_h6_depth(ctx: RuleContext) -> tuple[str, str]:
+    if analyze_h5_and_h6(ctx.index):
+        found = [text for level, text in ctx.index.outline if level in ("h5", "h6")]
+        return "Remove <h5> and <h6> tags; stop heading depth at <h4>.", "; ".join(found)
+    return "/", ""
+
+
+@rule("Paragraph Length", needs=("paragraphs",))
+def check_paragraph_length(ctx: RuleContext) -> tuple[str, str]:
+    para_issues = analyze_paragraphs(ctx.index, ctx.lang)
+    if para_issues:
+        first_para = next(iter(para_issues))
+        rec = (
+            "Break long paragraphs into 2–3 sentences each for readability. "
+            f"For example, the paragraph starting “{first_para[:100]}…” could be split."
+        )
+        return rec, first_para[:100] + "…"
+    return "/", ""
 
-        html_tag = content_soup.find('html')
-        if html_tag and html_tag.get('lang'):
-            lang_code = html_tag.get('lang').split('-')[0].lower()
-        else:
-            try:
-                lang_code = detect(full_text)
-            except Exception:
-                lang_code = "en"
-        lang_name = LANGUAGE_MAP.get(lang_code, "English")
-
-        metrics: dict[str, dict[str, str]] = {}
-        metrics["_lang"] = lang_code
-
-        # 1) Page Title
-        meta_title_text = meta_title_show(content_soup)
-        title_flag = analyze_meta_title(content_soup)
-        if not meta_title_text:
-            rec = "Add a page title of ~45 characters that includes your primary keyword."
-            example = "(none found)"
-        elif title_flag == 0:
-            rec = "Expand the page title to ~45 characters to improve SEO visibility."
-            example = meta_title_text
-        elif title_flag == 1:
-            rec = "Shorten the page title to ~45 characters to ensure it displays fully in search results."
-            example = meta_title_text
-        else:
-            rec = "/"
-            example = meta_title_text
-        metrics["Page Title"] = {"recommendation": rec, "example": example}
-
-        # Primary KW in Title
-        has_primary_in_title = analyze_primary(client, primary, meta_title_text)
-        if primary and not has_primary_in_title:
-            rec = f"Include your primary keyword (“{primary}”) in the page title for better relevance."
-            example = meta_title_text if meta_title_text else "(no title to show)"
-        else:
-            rec = "/"
-            example = meta_title_text if meta_title_text else ""
-        metrics["Primary KW in Title"] = {"recommendation": rec, "example": example}
-
-        # 2) Meta Description
-        meta_desc_text = meta_description(content_soup)
-        desc_flag = analyze_meta_description(content_soup)
-        if not meta_desc_text:
-            rec = "Add a meta description of ~130 characters that summarizes the page and includes a CTA."
-            example = "(none found)"
-        elif desc_flag == 0:
-            rec = "Expand the meta description to ~130 characters to improve click-through rates."
-            example = meta_desc_text
-        elif desc_flag == 1:
-            rec = "Shorten the meta description to ~130 characters so it doesn’t get cut off in search results."
-            example = meta_desc_text
-        else:
-            rec = "/"
-            example = meta_desc_text
-        metrics["Meta Description"] = {"recommendation": rec, "example": example}
-
-        # Primary KW in Description
-        has_primary_in_desc = analyze_primary(client, primary, meta_desc_text)
-        if primary and not has_primary_in_desc:
-            rec = f"Include your primary keyword (“{primary}”) in the meta description for better relevance."
-            example = meta_desc_text if meta_desc_text else ""
-        else:
-            rec = "/"
-            example = meta_desc_text if meta_desc_text else ""
-        metrics["Primary KW in Description"] = {"recommendation": rec, "example": example}
-
-        # 3) H1 Structure
-        h1_tags = content_soup.find_all("h1")
-        if not h1_tags:
-            rec = "Add exactly one <h1> tag that clearly states the page’s topic."
-            example = "(no H1 found)"
-        elif len(h1_tags) > 1:
-            rec = "Remove extra <h1> tags so there is only one main heading."
-            example = "; ".join([h.get_text(strip=True) for h in h1_tags])
-        else:
-            rec = "/"
-            example = h1_tags[0].get_text(strip=True)
-        metrics["H1 Structure"] = {"recommendation": rec, "example": example}
-
-        # Primary KW in H1
-        h1_text = h1_tags[0].get_text(strip=True) if h1_tags else ""
-        has_primary_in_h1 = analyze_primary(client, primary, h1_text)
-        if primary and not has_primary_in_h1:
-            rec = f"Include your primary keyword (“{primary}”) in the <h1> tag to signal relevance."
-            example = h1_text if h1_text else ""
-        else:
-            rec = "/"
-            example = h1_text if h1_text else ""
-        metrics["Primary KW in H1"] = {"recommendation": rec, "example": example}
-
-        # 4) H3 Presence & H5/H6 Depth
-        no_h3 = analyze_h3(content_soup)
-        if no_h3 and content_soup.find("h2"):
-            rec = "Add at least one <h3> subsection under each <h2> to improve hierarchy."
-            example = "(no H3 tags found)"
-        else:
-            rec = "/"
-            example = "(H3 present)" if not no_h3 else ""
-        metrics["H3 Presence"] = {"recommendation": rec, "example": example}
-
-        h5h6_flag = analyze_h5_and_h6(content_soup)
-        if h5h6_flag:
-            found = [h.get_text(strip=True) for h in content_soup.find_all(["h5","h6"])]
-            rec = "Remove <h5> and <h6> tags; stop heading depth at <h4>."
-            example = "; ".join(found)
-        else:
-            rec = "/"
-            example = ""
-        metrics["H5/H6 Depth"] = {"recommendation": rec, "example": example}
-
-        # 5) Paragraph Length & Bullet Lists
-        para_issues = analyze_paragraphs(content_soup)
-        if para_issues:
-            first_para = next(iter(para_issues))
-            rec = (
-                "Break long paragraphs into 2–3 sentences each for readability. "
-                f"For example, the paragraph starting “{first_para[:100]}…” could be split."
-            )
-            example = first_para[:100] + "…"
-        else:
-            rec = "/"
-            example = ""
-        metrics["Paragraph Length"] = {"recommendation": rec, "example": example}
-
-        no_lists = analyze_bullet_lists(content_soup)
-        if no_lists:
-            rec = "Add a bullet or numbered list where appropriate to improve scannability."
-            example = "(no <ul> or <ol> tags found)"
-        else:
-            rec = "/"
-            example = ""
-        metrics["Bullet List Presence"] = {"recommendation": rec, "example": example}
-
-        # 6) Internal Links
-        too_few_links, too_long_anchors, long_anchor_example = analyze_internal_links(url)
-        if too_few_links:
-            rec = "Add at least 5 internal links to relevant pages for better navigation."
-            example = "(found fewer than 5 valid internal links)"
-        else:
-            rec = "/"
-            example = ""
-        metrics["Internal Links Count"] = {"recommendation": rec, "example": example}
-
-        if too_long_anchors:
-            rec = (
-                "Shorten link anchor text to 6 words or fewer. "
-                f"For example, the anchor “{long_anchor_example}” is too long."
-            )
-            example = long_anchor_example
-        else:
-            rec = "/"
-            example = ""
-        metrics["Internal Link Anchor Length"] = {"recommendation": rec, "example": example}
-
-        # 7) Bold Text / Emphasis
-        too_few_bold = count_bold_text(content_soup)
-        if too_few_bold:
-            total_bold = len(list_bold_text(content_soup))
-            rec = (
-                "Bold at least 8 phrases to improve scannability. "
-                f"Currently only {total_bold} phrases are bolded."
-            )
-            example = f"(found {total_bold} bolded phrases)"
-        else:
-            rec = "/"
-            example = ""
-        metrics["Bold Text Count"] = {"recommendation": rec, "example": example}
-
-        too_long_bold = bold_words(content_soup)
-        if too_long_bold:
-            for txt in list_bold_text(content_soup):
-                if len(txt.split()) > 7:
-                    long_bold_example = txt
-                    break
-            rec = (
-                "Shorten lengthy bolded phrases to 7 words or fewer. "
-                f"For example: “{long_bold_example}”."
-            )
-            example = long_bold_example
-        else:
-            rec = "/"
-            example = ""
-        metrics["Bold Sequence Length"] = {"recommendation": rec, "example": example}
-
-        # 8) Secondary Keywords in Content
-        has_secondaries = analyze_sec(client, secondaries, full_text)
-        if secondaries and not has_secondaries:
-            rec = (
-                "Include your secondary keywords somewhere in the main content. "
-                f"Current secondaries: {secondaries}."
-            )
-            example = ", ".join(secondaries)
-        else:
-            rec = "/"
-            example = ""
-        metrics["Secondary KWs in Content"] = {"recommendation": rec, "example": example}
-
-        # 9) Images & Alt Text
-        non_logo_alts = show_images_text(content_soup)
-        total_non_logo_imgs = len(non_logo_alts)
-        word_count = len(full_text.split())
-
-        images_all = [
-            img
-            for img in content_soup.find_all('img')
-            if img.get('alt') is not None and 'logo' not in img.get('alt').lower()
-        ]
-        no_img = len(images_all)
 
+@rule("Bullet List Presence", needs=("lists",))
+def check_bullet_lists(ctx: RuleContext) -> tuple[str, str]:
+    if analyze_bullet_lists(ctx.index):
+        return "Add a bullet or numbered list where appropriate to improve scannability.", "(no <ul> or <ol> tags found)"
+    return "/", ""
 
-        if (word_count > 1500 and no_img < 3) or (400 <= word_count <= 1000 and no_img < 2):
-            needed = 3 if word_count > 1500 else 2
-            rec = (
-                f"At {word_count} words but only {no_img} images, add {needed - no_img} more images. "
-                "For instance: a chart of key data (alt: “Key data chart”) and a photo illustrating the topic."
-            )
-            example = f"({no_img} images found)"
-        else:
-            rec = "/"
-            example = ""
-        metrics["Images & Word Count Ratio"] = {"recommendation": rec, "example": example}
-
-        # missing_alts = [img.get("src") for img in content_soup.find_all("img") if not img.get("alt")]
-        # if missing_alts:
-        #     rec = (
-        #         f"{len(missing_alts)} image(s) lack alt text, which hurts accessibility. "
-        #         f"Add alt attributes like “Description of image” for each."
-        #     )
-        #     example = missing_alts[0] if missing_alts else ""
-        # else:
-        #     rec = "/"
-        #     example = ""
-        # metrics["Image Alt Text Presence"] = {"recommendation": rec, "example": example}
-
-        # missing_alts = [
-        #     img.get("src")
-        #     for img in content_soup.find_all("img")
-        #     # 1) Skip images whose alt contains “logo”
-        #     # 2) Then catch any image with no alt (or alt="")
-        #     if ('logo' not in (img.get("alt") or "").lower())
-        #     and not img.get("alt")
-        # ]
-        # if missing_alts:
-        #     rec = (
-        #         f"{len(missing_alts)} image(s) lack alt text, which hurts accessibility. "
-        #         f"Add alt attributes like “Description of image” for each."
-        #     )
-        #     example = missing_alts[0]
-        # else:
-        #     rec = "/"
-        #     example = ""
-
-        # metrics["Image Alt Text Presence"] = {"recommendation": rec, "example": example}
-
-        has_empty_alt = False
-        first_empty_alt_img = None
-        empty_alt_count = 0
-
-        # Iterate to find the first image with empty alt text
-        for img in images_all:
-            if img.get('alt').strip() == '':
-                has_empty_alt = True
-                first_empty_alt_img = img
-                empty_alt_count += 1
-
-        if has_empty_alt:
-            rec = (
-                f"{empty_alt_count} image(s) lack alt text, which hurts accessibility. "
-                f"Add alt attributes like “Description of image” for each."
-            )
-            example = first_empty_alt_img
-        else:
-            rec = "/"
-            example = ""
 
-        metrics["Image Alt Text Presence"] = {"recommendation": rec, "example": example}
+@rule("Internal Links Count", needs=("links",))
+def check_internal_links_count(ctx: RuleContext) -> tuple[str, str]:
+    too_few_links, _, _ = analyze_internal_links(ctx.url, ctx.index)
+    if too_few_links:
+        return ("Add at least 5 internal links to relevant pages for better navigation.",
+                "(found fewer than 5 valid internal links)")
+    return "/", ""
+
 
+@rule("Internal Link Anchor Length", needs=("links",))
+def check_internal_link_anchors(ctx: RuleContext) -> tuple[str, str]:
+    _, too_long_anchors, long_anchor_example = analyze_internal_links(ctx.url, ctx.index)
+    if too_long_anchors:
+        rec = (
+            "Shorten link anchor text to 6 words or fewer. "
+            f"For example, the anchor “{long_anchor_example}” is too long."
+        )
+        return rec, long_anchor_example
+    return "/", ""
 
 
-        if primary:
-            has_primary_in_alt = analyze_primary(client, primary, " ".join(non_logo_alts))
-            if not has_primary_in_alt:
-                rec = (
-                    "Include your primary keyword in at least one image’s alt text. "
-                    f"Current alts: {non_logo_alts if non_logo_alts else '(none)'}."
-                )
-                example = non_logo_alts[0] if non_logo_alts else ""
-            else:
-                rec = "/"
-                example = ""
+@rule("Bold Text Count", needs=("bold",))
+def check_bold_count(ctx: RuleContext) -> tuple[str, str]:
+    if count_bold_text(ctx.index):
+        total_bold = len(list_bold_text(ctx.index))
+        rec = (
+            "Bold at least 8 phrases to improve scannability. "
+            f"Currently only {total_bold} phrases are bolded."
+        )
+        return rec, f"(found {total_bold} bolded phrases)"
+    return "/", ""
+
+
+@rule("Bold Sequence Length", needs=("bold",))
+def check_bold_length(ctx: RuleContext) -> tuple[str, str]:
+    if bold_words(ctx.index):
+        long_bold_example = next(txt for txt in list_bold_text(ctx.index) if len(txt.split()) > 7)
+        rec = (
+            "Shorten lengthy bolded phrases to 7 words or fewer. "
+            f"For example: “{long_bold_example}”."
+        )
+        return rec, long_bold_example
+    return "/", ""
+
+
+@rule("Secondary KWs in Content", cost="llm", keyword_input="body")
+def check_secondaries_in_content(ctx: RuleContext) -> tuple[str, str]:
+    if ctx.secondaries and not ctx.kw_matches["secondary"]:
+        rec = (
+            "Include your secondary keywords somewhere in the main content. "
+            f"Current secondaries: {ctx.secondaries}."
+        )
+        return rec, ", ".join(ctx.secondaries)
+    return "/", ""
+
+
+def _non_logo_images(index: PageIndex) -> list[dict[str, str]]:
+    return [
+        img
+        for img in index.images
+        if img.get('alt') is not None and 'logo' not in img.get('alt').lower()
+    ]
+
+
+@rule("Images & Word Count Ratio", needs=("images", "text"))
+def check_images_word_ratio(ctx: RuleContext) -> tuple[str, str]:
+    word_count = len(ctx.index.full_text.split())
+    no_img = len(_non_logo_images(ctx.index))
+    if (word_count > 1500 and no_img < 3) or (400 <= word_count <= 1000 and no_img < 2):
+        needed = 3 if word_count > 1500 else 2
+        rec = (
+            f"At {word_count} words but only {no_img} images, add {needed - no_img} more images. "
+            "For instance: a chart of key data (alt: “Key data chart”) and a photo illustrating the topic."
+        )
+        return rec, f"({no_img} images found)"
+    return "/", ""
+
+
+@rule("Image Alt Text Presence", needs=("images",))
+def check_image_alt_presence(ctx: RuleContext) -> tuple[str, str]:
+    empty_alts = [img for img in _non_logo_images(ctx.index) if img.get('alt').strip() == '']
+    if empty_alts:
+        rec = (
+            f"{len(empty_alts)} image(s) lack alt text, which hurts accessibility. "
+            f"Add alt attributes like “Description of image” for each."
+        )
+        return rec, img_markup(empty_alts[0])
+    return "/", ""
+
+
+@rule("Primary KW in Image Alts", cost="llm", keyword_input="image_alts")
+def check_primary_in_image_alts(ctx: RuleContext) -> tuple[str, str]:
+    non_logo_alts = ctx.keyword_inputs["image_alts"]
+    if ctx.primary and not ctx.kw_matches["image_alts"]:
+        rec = (
+            "Include your primary keyword in at least one image’s alt text. "
+            f"Current alts: {non_logo_alts if non_logo_alts else '(none)'}."
+        )
+        return rec, non_logo_alts[0] if non_logo_alts else ""
+    return "/", ""
+
+
+def _metric(check, ctx: RuleContext) -> dict[str, str]:
+    # metrics must hold plain strings: no parse-tree objects kept alive
+    rec, example = check(ctx)
+    return {"recommendation": str(rec), "example": example if isinstance(example, str) else str(example)}
+
+
+def analyze_page_local(url: str, index: PageIndex, info: dict[str, any],
+                       rules: list[Rule] | None = None,
+                       lang: str | None = None) -> tuple[dict[str, any], dict[str, any]]:
+    # One dispatch pass over the enabled rules: every local and network rule
+    # runs now (cheapest first); "llm" rules are left as None placeholders in
+    # report order. The second return value holds the page texts
+    # finish_keyword_metrics() needs for them.
+    rules = enabled_rules() if rules is None else rules
+    lang_code = lang or page_language(url, index)
+
+    metrics: dict[str, dict[str, str]] = {"_lang": lang_code}
+    metrics.update((r.name, None) for r in rules)
+    ctx = RuleContext(url, index, info, lang=lang_code)
+    for r in sorted(rules, key=lambda r: RULE_COSTS.index(r.cost)):
+        if r.cost != "llm":
+            with INSTRUMENTS.timed("rule", r.name):
+                metrics[r.name] = _metric(r.check, ctx)
+
+    keyword_inputs = {}
+    for r in rules:
+        if r.keyword_input:
+            keyword_inputs[r.keyword_input] = KEYWORD_INPUTS[r.keyword_input][1](index)
+    return metrics, keyword_inputs
+
+
+LLM_CHECK_FAILED = "Could not check (the LLM request failed) – re-run the audit for this page."
+LLM_ERRORS = (openai.OpenAIError, LLMUnavailableError)
+
+
+def finish_keyword_metrics(metrics: dict[str, any], keyword_inputs: dict[str, any], info: dict[str, any],
+                           kw_matches: dict[str, bool] | None, url: str = "",
+                           rules: list[Rule] | None = None) -> dict[str, any]:
+    # Fills the "llm" placeholders left by analyze_page_local(). kw_matches
+    # None means the LLM could not be reached: the report says so instead of
+    # claiming the keyword is missing.
+    ctx = RuleContext(url, None, info, keyword_inputs, kw_matches, lang=metrics.get("_lang", ""))
+    for r in enabled_rules() if rules is None else rules:
+        if r.cost == "llm" and kw_matches is None:
+            metrics[r.name] = {"recommendation": LLM_CHECK_FAILED, "example": ""}
+        elif r.cost == "llm":
+            with INSTRUMENTS.timed("rule", r.name):
+                metrics[r.name] = _metric(r.check, ctx)
+    return metrics
+
+
+def match_keyword_inputs(client: openai.Client, info: dict[str, any], keyword_inputs: dict[str, any],
+                         matcher=None, lang: str | None = None) -> dict[str, bool] | None:
+    # All keyword checks for the page go out as one batched LLM request; only
+    # the inputs of enabled keyword rules are asked about. None if the LLM
+    # could not be reached.
+    if not keyword_inputs:
+        return {}
+    fields = {
+        name: " ".join(text) if name == "image_alts" else text
+        for name, text in keyword_inputs.items()
+        if name != "body"
+    }
+    has_body = "body" in keyword_inputs
+    try:
+        return match_page_keywords(
+            client, info.get("primary_kw", ""), info.get("secondary_kw", []) if has_body else [],
+            fields,
+            keyword_inputs.get("body", ""),
+            matcher=matcher,
+            lang=lang,
+        )
+    except LLM_ERRORS as exc:
+        logger.warning(f"⚠️ Keyword checks failed: {exc}")
+        INSTRUMENTS.count("llm_failures")
+        return None
+
+
+def analyze_page(url: str, index: PageIndex, info: dict[str, any], client: openai.Client,
+                 matcher=None, rules: list[Rule] | None = None) -> dict[str, any]:
+    rules = enabled_rules() if rules is None else rules
+    metrics, keyword_inputs = analyze_page_local(url, index, info, rules)
+    kw_matches = match_keyword_inputs(client, info, keyword_inputs, matcher, metrics["_lang"])
+    return finish_keyword_metrics(metrics, keyword_inputs, info, kw_matches, url, rules)
+
+
+# Worker processes for the CPU-bound parse + local checks (0 = run them in
+# the calling thread). LLM calls always stay in the parent process.
+ANALYSIS_PROCESSES = int(os.getenv("ANALYSIS_PROCESSES", 0))
+
+# Pages whose keyword checks (LLM round trips) run at the same time. Keep it
+# at or above LLM_MAX_CONCURRENCY so the gateway's cap is what limits.
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", LLM_MAX_CONCURRENCY))
+
+FETCH_ERROR = "Could not fetch page (HTTP error or 429) – skipped analysis"
+
+
+def analyze_html_local(url: str, body: bytes, encoding: str | None, info: dict[str, any], backend: str,
+                       matcher_name: str, rule_names: list[str], collect_links: bool = False, with_fingerprint: bool = False,
+                       host_lang: str | None = None):
+    # Runs in a worker process: the undecoded body in (decoded, or for lxml
+    # parsed natively, here rather than in the parent), compact picklable
+    # results out.
+    # Rules travel by name and are looked up in the worker's registry. The
+    # fingerprint is only computed when there is a result store to check.
+    # host_lang is the parent's HostLanguages entry for the page's host; the
+    # entry after this page (a new confident detection) is returned for it.
+    rules = [RULES[name] for name in rule_names]
+    tags = rule_index_tags(rules)
+    if collect_links and "a" not in tags:
+        tags.append("a")
+    with INSTRUMENTS.page(url):
+        with INSTRUMENTS.timed("parse"):
+            doc = clean_html(body, backend, encoding=encoding)
+        with INSTRUMENTS.timed("index"):
+            index = PageIndex(doc, tags)
+        host = urlparse(url).netloc
+        hosts = HostLanguages()
+        if host_lang:
+            hosts.put(host, host_lang)
+        lang_code = page_language(url, index, hosts)
+        metrics, keyword_inputs = analyze_page_local(url, index, info, rules, lang=lang_code)
+    fingerprint = (page_fingerprint(index, info, matcher_name, rule_names, lang_code)
+                   if with_fingerprint else None)
+    links = [href for href, _text in index.links] if collect_links else None
+    return metrics, keyword_inputs, fingerprint, links, hosts.get(host), INSTRUMENTS.snapshot(reset=True)
+
+
+def _init_analysis_worker(metrics_enabled: bool) -> None:
+    # fresh instruments per worker: forked workers would inherit the parent's
+    INSTRUMENTS.enabled = metrics_enabled
+    INSTRUMENTS.reset()
+
+
+def iter_page_metrics(urls: Iterable[str], keywords_dict: dict[str, dict[str, any]], client: openai.Client,
+                      page_store: PageStore | None = None,
+                      crawler: Crawler | PageSource | None = None,
+                      matcher=None,
+                      result_store: ResultStore | None = None,
+                      processes: int = ANALYSIS_PROCESSES,
+                      rules: list[Rule] | None = None,
+                      llm_workers: int = LLM_WORKERS,
+                      link_graph: LinkGraph | None = None) -> Iterator[tuple[str, dict[str, any]]]:
+    # Yields (url, metrics) as each page finishes, in completion order.
+    # Metrics hold plain strings only, and pages fetched here are dropped
+    # from the page store once analyzed, so memory stays flat on long runs.
+    # rules defaults to enabled_rules() (RULE_PROFILE / RULES_DISABLED);
+    # pages without keywords (e.g. found in a sitemap) only get the rules
+    # that don't need them. With link_graph, every fetched page's internal
+    # links are added to it.
+    rules = enabled_rules() if rules is None else rules
+    structural_rules = [r for r in rules if r.cost != "llm"]
+    host_languages = HostLanguages()
+
+    def _rules_for(info: dict[str, any]) -> list[Rule]:
+        return rules if info.get("primary_kw") or info.get("secondary_kw") else structural_rules
+    own_store = page_store is None
+    if own_store:
+        tags = rule_index_tags(rules)
+        if link_graph is not None and "a" not in tags:
+            tags.append("a")
+        page_store = PageStore(tags=tags)
+    if crawler is None:
+        crawler = Crawler()
+    if result_store is None and RESULT_STORE_PATH:
+        result_store = ResultStore(RESULT_STORE_PATH)
+    matcher = matcher or get_keyword_matcher()
+    matcher_name = type(matcher).__name__
+    ready: deque[tuple[str, dict[str, any]]] = deque()
+
+    def _stored(url: str, fingerprint: str | None) -> dict[str, any] | None:
+        if result_store is None:
+            return None
+        stored = result_store.get(url, fingerprint)
+        if stored is not None:
+            result_store.touch(url)
+            logger.info(f"♻️ {url} is unchanged since the last audit – reusing stored results.")
+        return stored
+
+    def _done(url: str, metrics: dict[str, any]) -> None:
+        INSTRUMENTS.count("pages_failed" if "error" in metrics else "pages_audited")
+        if INSTRUMENTS.enabled:
+            # per-URL breakdown, added after the result store saw the metrics
+            metrics = dict(metrics, _timings=INSTRUMENTS.pop_page(url))
+        ready.append((url, metrics))
+
+    # keyword matching (the LLM round trips) runs on its own small pool, so the
+    # gateway sees concurrent requests while fetching and parsing go on
+    llm_pool = ThreadPoolExecutor(max_workers=llm_workers, initializer=crawler.worker_init) if llm_workers > 1 else None
+    llm_backlog = llm_workers * 2
+    llm_jobs: set = set()
+
+    def _finish(url: str, info: dict[str, any], metrics: dict[str, any], keyword_inputs: dict[str, any],
+                fingerprint: str | None) -> None:
+        if llm_pool is None:
+            _finish_page(url, info, metrics, keyword_inputs, fingerprint)
         else:
-            rec = "/"
-            example = ""
-        metrics["Primary KW in Image Alts"] = {"recommendation": rec, "example": example}
+            llm_jobs.add(llm_pool.submit(_finish_page, url, info, metrics, keyword_inputs, fingerprint))
+
+    def _flush(pending: int) -> Iterator[tuple[str, dict[str, any]]]:
+        # hands over finished pages, blocking while more than `pending`
+        # pages still wait on keyword matching
+        while True:
+            for future in [f for f in llm_jobs if f.done()]:
+                llm_jobs.discard(future)
+                future.result()  # re-raise anything unexpected
+            while ready:
+                yield ready.popleft()
+            if len(llm_jobs) <= pending:
+                return
+            wait(llm_jobs, return_when=FIRST_COMPLETED)
+
+    def _finish_page(url: str, info: dict[str, any], metrics: dict[str, any], keyword_inputs: dict[str, any],
+                     fingerprint: str | None) -> None:
+        with INSTRUMENTS.page(url):
+            kw_matches = match_keyword_inputs(client, info, keyword_inputs, matcher, metrics.get("_lang"))
+            metrics = finish_keyword_metrics(metrics, keyword_inputs, info, kw_matches, url, _rules_for(info))
+        if result_store is not None and kw_matches is not None:
+            # results with failed keyword checks are not reused next time
+            result_store.put(url, fingerprint, metrics)
+        _done(url, metrics)
+
+    def _analyze(url: str) -> None:
+        with INSTRUMENTS.page(url):
+            index = page_store.index(url)
+        if own_store:
+            page_store.discard(url)
+        if index is None:
+            if link_graph is not None:
+                link_graph.add_broken(url)
+            _done(url, {"error": FETCH_ERROR})
+            return
+        if link_graph is not None:
+            link_graph.add_page(url, [href for href, _text in index.links])
+        info = keywords_dict.get(url, {})
+        page_rules = _rules_for(info)
+        lang_code = page_language(url, index, host_languages)
+        fingerprint = (page_fingerprint(index, info, matcher_name, [r.name for r in page_rules],
+                                        lang_code)
+                       if result_store is not None else None)
+        stored = _stored(url, fingerprint)
+        if stored is not None:
+            _done(url, stored)
+            return
+        with INSTRUMENTS.page(url):
+            metrics, keyword_inputs = analyze_page_local(url, index, info, page_rules,
+                                                         lang=lang_code)
+        _finish(url, info, metrics, keyword_inputs, fingerprint)
+
+    def _pending() -> Iterator[str]:
+        # urls is consumed lazily by the crawler. Pages already in the store
+        # are analyzed right away; the rest are analyzed as the crawler hands
+        # them over, while later fetches are still in flight.
+        seen = set()
+        for url in urls:
+            if url in seen:
+                continue
+            seen.add(url)
+            if url in page_store:
+                _analyze(url)
+            else:
+                yield url
+
+    try:
+        if not processes:
+            for url, soup in crawler.crawl(_pending()):
+                page_store.put(url, soup)
+                _analyze(url)
+                yield from _flush(llm_backlog)
+            yield from _flush(0)
+            return
 
+        # Process mode: the crawler hands over raw bodies, workers parse them and run
+        # the local checks, and the parent only does keyword matching (LLM I/O).
+        jobs = {}
+
+        def _collect(block: bool) -> None:
+            if not jobs:
+                return
+            done, _ = wait(jobs, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = jobs.pop(future)
+                info = keywords_dict.get(url, {})
+                metrics, keyword_inputs, fingerprint, links, host_lang, worker_metrics = future.result()
+                INSTRUMENTS.merge(worker_metrics)
+                if host_lang:
+                    host_languages.put(urlparse(url).netloc, host_lang)
+                if link_graph is not None:
+                    link_graph.add_page(url, links)
+                stored = _stored(url, fingerprint)
+                if stored is not None:
+                    _done(url, stored)
+                else:
+                    _finish(url, info, metrics, keyword_inputs, fingerprint)
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_analysis_worker,
+                                 initargs=(INSTRUMENTS.enabled,)) as pool:
+            for url, fetched in crawler.crawl(_pending(), raw=True):
+                if fetched is None:
+                    if link_graph is not None:
+                        link_graph.add_broken(url)
+                    _done(url, {"error": FETCH_ERROR})
+                else:
+                    info = keywords_dict.get(url, {})
+                    jobs[pool.submit(analyze_html_local, url, *fetched, info, PARSER_BACKEND, matcher_name,
+                                     [r.name for r in _rules_for(info)], link_graph is not None,
+                                     result_store is not None,
+                                     host_languages.get(urlparse(url).netloc))] = url
+                # keep a bounded backlog of parsed-but-unfinished pages
+                _collect(block=len(jobs) >= processes * 4)
+                yield from _flush(llm_backlog)
+            while jobs:
+                _collect(block=True)
+                yield from _flush(llm_backlog)
+        yield from _flush(0)
+    finally:
+        if llm_pool is not None:
+            llm_pool.shutdown(wait=True)
+
+
+def analyze_kws_from_csv(urls: Iterable[str], keywords_dict: dict[str, dict[str, any]], client: openai.Client,
+                         page_store: PageStore | None = None,
+                         crawler: Crawler | PageSource | None = None,
+                         matcher=None,
+                         on_result=None,
+                         result_store: ResultStore | None = None,
+                         processes: int = ANALYSIS_PROCESSES,
+                         rules: list[Rule] | None = None,
+                         link_graph: LinkGraph | None = None) -> dict[str, dict[str, any]]:
+    # Collects iter_page_metrics() into one dict in input order. on_result(url,
+    # metrics), if given, is called as soon as each page is done. For large
+    # runs, iterate iter_page_metrics() directly instead.
+    order: list[str] = []
+
+    def _urls() -> Iterator[str]:
+        for url in urls:
+            order.append(url)
+            yield url
+
+    results: dict[str, dict[str, any]] = {}
+    for url, metrics in iter_page_metrics(_urls(), keywords_dict, client, page_store, crawler, matcher,
+                                          result_store, processes, rules, link_graph=link_graph):
         results[url] = metrics
+        if on_result is not None:
+            on_result(url, metrics)
+    return {url: results[url] for url in dict.fromkeys(order)}
+
+
+def analyze_keyword_groups(groups: Iterable[tuple[str, str, list[str]]], client: openai.Client,
+                           page_store: PageStore | None = None,
+                           crawler: Crawler | PageSource | None = None,
+                           matcher=None,
+                           rules: list[Rule] | None = None) -> dict[str, dict[str, any]]:
+    # Same as analyze_kws_from_csv, fed straight from iter_keyword_groups() so
+    # crawling starts before the keywords file has been read to the end.
+    keywords_dict: dict[str, dict[str, any]] = {}
 
-    return results
+    def _urls() -> Iterator[str]:
+        for url, primary, secondaries in groups:
+            keywords_dict[url] = {"primary_kw": primary, "secondary_kw": secondaries}
+            yield url
+
+    return analyze_kws_from_csv(_urls(), keywords_dict, client, page_store, crawler, matcher, rules=rules)
 
 
 # -----------------------------------------------------------------------------
 # SECTION 4: NEW FUNCTION TO GET A CONVERSATIONAL TIP FOR A SINGLE ISSUE
 # -----------------------------------------------------------------------------
 
-def get_conversational_tip(client: openai.Client, metric_name: str, issue_text: str, current_text: str, kw_list: list[str] | None = None) -> str:
+def _tip_messages(metric_name: str, issue_text: str, current_text: str, kw_list: list[str] | None = None,
+                  lang: str | None = None) -> list[dict[str, str]]:
 
     prompt = (f"You are an SEO consultant, specialized in clear communication and practical solutions. A page owner sees this raw issue for '{metric_name}':\n\n"
         f"    {issue_text} because this is the current vesrsion of the metric: {current_text} \n\n")
@@ -638,39 +3335,297 @@ def get_conversational_tip(client: openai.Client, metric_name: str, issue_text:
 
         f"For every {metric_name} write max 7 sentences."
     )
+    # examples must be in the page's own language to be usable as-is
+    if LANGUAGE_MAP.get(lang or ""):
+        prompt += f" Write the explanation and every example in {LANGUAGE_MAP[lang]}."
 
+    return [
+        {"role": "system", "content": "You are a friendly SEO content advisor."},
+        {"role": "user",   "content": prompt}
+    ]
 
+
+def get_conversational_tip(client: openai.Client, metric_name: str, issue_text: str, current_text: str, kw_list: list[str] | None = None,
+                           lang: str | None = None) -> str:
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a friendly SEO content advisor."},
-                {"role": "user",   "content": prompt}
-            ],
-            temperature=0.1
-        )
+        with INSTRUMENTS.timed("tip", metric_name):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=_tip_messages(metric_name, issue_text, current_text, kw_list, lang),
+                temperature=0.1
+            )
+        _count_llm_usage(response)
         return response.choices[0].message.content.strip()
     except Exception as exc:
         return f"(Error getting tip: {exc})"
 
 
+def stream_conversational_tip(client: openai.Client, metric_name: str, issue_text: str, current_text: str, kw_list: list[str] | None = None,
+                              lang: str | None = None) -> Iterator[str]:
+    # Same tip as get_conversational_tip, yielded token chunk by token chunk
+    try:
+        with INSTRUMENTS.timed("tip", metric_name):
+            stream = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=_tip_messages(metric_name, issue_text, current_text, kw_list, lang),
+                temperature=0.1,
+                stream=True
+            )
+            INSTRUMENTS.count("llm_calls")
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    except Exception as exc:
+        yield f"(Error getting tip: {exc})"
+
+
+TIP_WORKERS = 6
+
+
+def generate_tips_concurrently(client: openai.Client, jobs: list[tuple], max_workers: int = TIP_WORKERS) -> Iterator[tuple[any, str, bool]]:
+    # jobs are (key, metric_name, issue_text, current_text, kw_list, lang). Tips are
+    # streamed from a bounded pool; yields (key, text_so_far, done) in arrival
+    # order, so the caller (the Streamlit script thread) does all rendering.
+    events: queue.Queue = queue.Queue()
+
+    def _run(key, args):
+        text = ""
+        try:
+            for piece in stream_conversational_tip(client, *args):
+                text += piece
+                events.put((key, text, False))
+        finally:
+            events.put((key, text.strip(), True))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for key, *args in jobs:
+            pool.submit(_run, key, args)
+        remaining = len(jobs)
+        while remaining:
+            key, text, done = events.get()
+            if done:
+                remaining -= 1
+            yield key, text, done
+
+
 # -----------------------------------------------------------------------------
 # SECTION 5: STREAMLIT APP
 # -----------------------------------------------------------------------------
 
 # Make sure your OPENAI_API_KEY is set in environment
 # === Configuration ===
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.Client(api_key=openai.api_key)
-# client = openai.Client(api_key=openai.api_key)
+_openai_client: openai.Client | None = None
+
+
+def get_openai_client() -> LLMGateway:
+    # created on first use, so importing this module never needs the key
+    global _openai_client
+    if _openai_client is None:
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        _openai_client = LLMGateway(openai.AsyncOpenAI(api_key=openai.api_key))
+    return _openai_client
+
+
+class StreamlitLogHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        if get_script_run_ctx() is None:
+            return  # background analysis threads log to their job instead
+        try:
+            st.write(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+# Analyses run as background jobs keyed by a hash of their inputs (URLs, their
+# keywords and the rule set), shared by every session of the app. A finished
+# job stays reusable for APP_CACHE_TTL seconds, results and generated tips
+# included, so re-running the same analysis costs no fetches or LLM calls.
+APP_CACHE_TTL = float(os.getenv("APP_CACHE_TTL", 3600))
+
+
+class _JobLogHandler(logging.Handler):
+    # keeps the records logged on behalf of one job (see _log_job)
+    def __init__(self, lines: deque, job: str):
+        super().__init__(logging.INFO)
+        self.lines = lines
+        self.job = job
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if _log_job.get() != self.job:
+            return
+        self.lines.append(self.format(record))
+
+
+class AnalysisJob:
+    # One background run of iter_page_metrics(); the script thread only reads
+    # it. Only log lines of this job's own threads end up in its log.
+    def __init__(self, key: str, urls: list[str], keywords_dict: dict[str, dict[str, any]]):
+        self.key = key
+        self.urls = urls
+        self.keywords_dict = keywords_dict
+        self.results: dict[str, dict[str, any]] = {}
+        self.tips: dict[tuple[str, str], str] = {}
+        self.log: deque[str] = deque(maxlen=50)
+        self.error: str | None = None
+        self.finished_at: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def run(self, client: openai.Client) -> None:
+        _log_job.set(self.key)
+        handler = _JobLogHandler(self.log, self.key)
+        logger.addHandler(handler)
+        try:
+            crawler = Crawler(worker_init=partial(_log_job.set, self.key))
+            for url, metrics in iter_page_metrics(self.urls, self.keywords_dict, client, crawler=crawler):
+                self.results[url] = metrics
+        except Exception as exc:
+            logger.exception("Analysis job failed")
+            self.error = str(exc)
+        finally:
+            logger.removeHandler(handler)
+            self.finished_at = time.time()
+
+
+def analysis_key(urls: list[str], keywords_dict: dict[str, dict[str, any]]) -> str:
+    payload = json.dumps({
+        "urls": urls,
+        "keywords": [keywords_dict.get(url, {}) for url in urls],
+        "ruleset": RULESET_VERSION,
+        "rules": [r.name for r in enabled_rules()],
+        "matcher": KEYWORD_MATCHER,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisJobs:
+    def __init__(self, ttl: float = APP_CACHE_TTL):
+        self.ttl = ttl
+        self._jobs: dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key in [k for k, job in self._jobs.items() if job.finished and now - job.finished_at > self.ttl]:
+            del self._jobs[key]
+
+    def get(self, key: str | None) -> AnalysisJob | None:
+        with self._lock:
+            self._expire()
+            return self._jobs.get(key)
+
+    def start(self, urls: list[str], keywords_dict: dict[str, dict[str, any]], client: openai.Client) -> AnalysisJob:
+        # the running or still-fresh job for these inputs, else a new one
+        key = analysis_key(urls, keywords_dict)
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None and job.error is None:
+                return job
+            job = self._jobs[key] = AnalysisJob(key, urls, keywords_dict)
+        threading.Thread(target=job.run, args=(client,), name=f"analysis-{key[:8]}", daemon=True).start()
+        return job
+
+
+@st.cache_resource
+def get_analysis_jobs() -> AnalysisJobs:
+    return AnalysisJobs()
+
+
+@st.cache_data(ttl=APP_CACHE_TTL, show_spinner=False)
+def parse_keywords_bytes(data: bytes) -> dict[str, dict[str, any]]:
+    # cached on the uploaded file's content
+    return parse_keywords_csv(io.BytesIO(data))
+
+
+@st.fragment(run_every=1.0)
+def _job_progress(job: AnalysisJob) -> None:
+    # redrawn every second while the job runs; a full rerun shows the results
+    if job.finished:
+        st.rerun()
+    done, total = len(job.results), len(job.urls)
+    st.progress(done / total if total else 0.0, text=f"Fetching pages and running SEO analysis… {done}/{total}")
+    for line in list(job.log)[-5:]:
+        st.caption(line)
+
+
+def _render_issues(client: openai.Client, job: AnalysisJob, url: str) -> None:
+    single_result = job.results.get(url, {})
+    if "error" in single_result:
+        st.error(single_result["error"])
+        return
+    primary_kw    = job.keywords_dict.get(url, {}).get("primary_kw", "")      # a single string
+    secondary_kws = job.keywords_dict.get(url, {}).get("secondary_kw", [])    # a list of strings
+
+    # Now, for each metric whose recommendation != "/", show a conversational tip.
+    st.subheader("💬 Smart Fix Suggestions (Examples Stay On‐Topic)")
+    any_issue = False
+    tip_jobs = []
+    tip_slots = {}
+
+    for metric, data in single_result.items():
+        if metric.startswith("_"):
+            continue  # skip language code and timings
+
+        raw_rec = data.get("recommendation", "")
+        example = data.get("example", "")  # this is the current text, e.g. current meta title/description
+
+        if raw_rec and raw_rec != "/":
+            any_issue = True
+            st.markdown(f"**{metric}:** {raw_rec}")
+            if example:
+                st.markdown(f"_Current content:_ “{example}”")
+            else:
+                st.markdown("_Current content: (none found)_")
+
+            if "Primary KW" in metric:
+                kw_list = [primary_kw] if primary_kw else None
+            elif "Secondary KWs" in metric:
+                kw_list = secondary_kws if secondary_kws else None
+            else:
+                kw_list = None
+
+            # Reserve a slot for the tip; tips not generated yet are generated together below
+            tip_slots[metric] = st.empty()
+            if (url, metric) in job.tips:
+                tip_slots[metric].markdown(f"> {job.tips[(url, metric)]}")
+            else:
+                tip_slots[metric].markdown(f"_Generating tip for '{metric}'…_")
+                tip_jobs.append((metric, metric, raw_rec, example, kw_list, single_result.get("_lang")))
+            st.markdown("---")
+
+    # Fetch conversational tips concurrently, passing along the actual current
+    # example, and render each one as its tokens arrive
+    for metric, tip, done in generate_tips_concurrently(client, tip_jobs):
+        tip_slots[metric].markdown(f"> {tip}")
+        if done and not tip.startswith("(Error getting tip"):
+            job.tips[(url, metric)] = tip
+
+    if not any_issue:
+        st.success("🎉 No actionable issues found! Your page meets the main SEO criteria we checked.")
+
+
+def _issue_count(metrics: dict[str, any]) -> int:
+    return sum(1 for name, data in metrics.items()
+               if not name.startswith("_") and name != "error" and data.get("recommendation", "/") != "/")
+
 
 def main():
     st.set_page_config(layout="wide")
+    if not any(isinstance(h, StreamlitLogHandler) for h in logger.handlers):
+        handler = StreamlitLogHandler()
+        handler.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    client = get_openai_client()
+    jobs = get_analysis_jobs()
     st.title("🔍 SEO Content Analyzer with On‐Topic Fix Suggestions")
 
     st.write("""
-    1. Paste a full URL.  
-    2. Upload a CSV file with columns: url, primary kw, secundary kw.  
+    1. Paste a full URL, or choose to analyze every URL in the CSV, or every page in the sitemaps of the pasted site or sitemap URL.  
+    2. Upload a CSV file with columns: url, primary kw, secundary kw (optional for sitemaps: pages without keywords get the checks that need none).  
     3. Click **Analyze**.  
 
     The app will run an SEO analysis and then, for each issue found, fetch a **conversational tip** from OpenAI that:
@@ -681,72 +3636,335 @@ def main():
 
     url_input = st.text_input("📥 Paste your URL here", key="url_input")
     csv_file = st.file_uploader("📑 Upload keywords CSV", type="csv")
+    scope = st.radio("Analyze", ["The pasted URL", "Every URL in the CSV", "Every page in the sitemaps"],
+                     horizontal=True, key="scope")
 
     if st.button("📈 Analyze"):
-        if not url_input:
+        if scope != "Every URL in the CSV" and not url_input:
             st.error("Please paste a URL before clicking Analyze.")
             return
-        if csv_file is None:
+        if csv_file is None and scope != "Every page in the sitemaps":
             st.error("Please upload a keywords CSV file before clicking Analyze.")
             return
 
         try:
-            keywords_dict = parse_keywords_csv(csv_file)
+            keywords_dict = parse_keywords_bytes(csv_file.getvalue()) if csv_file is not None else {}
         except Exception as e:
             st.error(f"Could not parse CSV file: {e}")
             return
 
-        if url_input not in keywords_dict:
+        if scope == "Every page in the sitemaps":
+            with st.spinner("Reading sitemaps…"):
+                joined = {url: info for url, _lastmod, info in join_keywords(iter_sitemap_pages([url_input]),
+                                                                             keywords_dict)}
+            if not joined:
+                st.error("No pages found in the sitemaps.")
+                return
+            urls, keywords_dict = list(joined), joined
+        elif scope == "Every URL in the CSV":
+            urls = list(keywords_dict)
+        elif url_input not in keywords_dict:
             st.error("The pasted URL was not found in your CSV. Please ensure it is included.")
             return
-        
-        primary_kw    = keywords_dict[url_input]["primary_kw"]       # a single string
-        secondary_kws = keywords_dict[url_input]["secondary_kw"]     # a list of strings
+        else:
+            urls = [url_input]
+        st.session_state["analysis_job"] = jobs.start(urls, keywords_dict, client).key
+
+    # the job outlives reruns (widget clicks), so its results and tips do too
+    job = jobs.get(st.session_state.get("analysis_job"))
+    if job is None:
+        return
+    if not job.finished:
+        _job_progress(job)
+        return
+    if job.error:
+        st.error(f"The analysis failed: {job.error}")
+        return
+
+    if len(job.urls) == 1:
+        _render_issues(client, job, job.urls[0])
+        return
+    st.dataframe(
+        [{"url": url, "issues": _issue_count(metrics), "error": metrics.get("error", "")}
+         for url, metrics in job.results.items()]
+    )
+    url = st.selectbox("🔎 Show fix suggestions for", [url for url in job.urls if url in job.results])
+    if url:
+        _render_issues(client, job, url)
 
-        with st.spinner("Fetching page and running SEO analysis…"):
-            analysis_results = analyze_kws_from_csv([url_input], keywords_dict, client)
+# -----------------------------------------------------------------------------
+# SECTION 6: HEADLESS BATCH CLI
+# -----------------------------------------------------------------------------
 
-        single_result = analysis_results.get(url_input, {})
-        if "error" in single_result:
-            st.error(single_result["error"])
+def _trim_partial_line(path: str) -> None:
+    # a crash mid-write can leave half a JSON line at the end of the file
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+
+
+def _load_checkpoint(path: str) -> set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as fh:
+        return {line.rstrip("\n") for line in fh if line.endswith("\n")}
+
+
+def _audit_failed(metrics: dict[str, any]) -> bool:
+    # fetch errors and pages with an LLM check that couldn't run are retried
+    # on the next run instead of being checkpointed
+    if "error" in metrics:
+        return True
+    return any(isinstance(m, dict) and m.get("recommendation") == LLM_CHECK_FAILED
+               for m in metrics.values())
+
+
+def _drop_unfinished(jsonl_path: str, done: set[str]) -> None:
+    # results of URLs that aren't checkpointed (failed ones) are re-audited,
+    # so their old lines go rather than appearing twice
+    if not os.path.exists(jsonl_path):
+        return
+    with open(jsonl_path, encoding="utf-8") as fh:
+        lines = fh.readlines()
+    kept = [line for line in lines if json.loads(line)["url"] in done]
+    if len(kept) == len(lines):
+        return
+    tmp_path = jsonl_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.writelines(kept)
+    os.replace(tmp_path, jsonl_path)
+    logger.info("Retrying %d URL(s) that failed last time", len(lines) - len(kept))
+
+
+def _jsonl_to_parquet(jsonl_path: str, parquet_path: str) -> None:
+    import pandas as pd  # pyarrow (or fastparquet) must also be installed
+
+    rows = []
+    with open(jsonl_path, encoding="utf-8") as fh:
+        for line in fh:
+            record = json.loads(line)
+            metrics = record["metrics"]
+            rows.append({
+                "url": record["url"],
+                "primary_kw": record["primary_kw"],
+                "secondary_kw": json.dumps(record["secondary_kw"], ensure_ascii=False),
+                "lang": metrics.get("_lang", ""),
+                "error": metrics.get("error", ""),
+                "metrics": json.dumps(metrics, ensure_ascii=False),
+            })
+    pd.DataFrame(rows).to_parquet(parquet_path, index=False)
+
+
+def _write_link_report(graph: LinkGraph, path: str) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["url", "inbound", "outbound", "depth", "orphan", "broken"])
+        for url, stats in graph.report():
+            writer.writerow([url, stats["inbound"], stats["outbound"],
+                             "" if stats["depth"] is None else stats["depth"], int(stats["orphan"]),
+                             int(stats["broken"])])
+
+
+def run_cli(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Audit every URL in a keywords CSV (columns: url, primary kw, secundary kw) and/or in a "
+                    "site's sitemaps without Streamlit.")
+    parser.add_argument("csv", nargs="?", help="keywords CSV file (optional with --sitemap or --source)")
+    parser.add_argument("-o", "--output", required=True, help="results file (.jsonl or .parquet)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"],
+                        help="output format (default: from the output file extension)")
+    parser.add_argument("--checkpoint",
+                        help="file listing completed URLs, used to resume; URLs that failed to fetch or whose "
+                             "LLM checks failed are retried (default: <output>.done)")
+    parser.add_argument("--no-resume", action="store_true", help="start over, ignoring any checkpoint")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent fetches (default: 8)")
+    parser.add_argument("--per-host", type=int, default=2, help="concurrent fetches per host (default: 2)")
+    parser.add_argument("--rate", type=float, default=5.0, help="requests per second per host (default: 5)")
+    parser.add_argument("--processes", type=int, default=ANALYSIS_PROCESSES,
+                        help="worker processes for parsing and local checks (default: 0, in-process)")
+    parser.add_argument("--matcher", choices=["llm", "local"], default=KEYWORD_MATCHER,
+                        help="keyword matcher backend")
+    parser.add_argument("--profile", choices=sorted(RULE_PROFILES), default=RULE_PROFILE,
+                        help="which rule costs to run: full, no-llm or local (default: full)")
+    parser.add_argument("--disable-rule", action="append", default=None, metavar="NAME",
+                        help="skip a rule by report name (repeatable; default: RULES_DISABLED)")
+    parser.add_argument("--sitemap", action="append", default=[], metavar="URL",
+                        help="also audit every page of this sitemap or sitemap index (.xml or .xml.gz), or of a "
+                             "site's sitemaps given its root URL (repeatable). Pages missing from the CSV get "
+                             "the checks that need no keywords")
+    parser.add_argument("--since", metavar="DATE",
+                        help="with --sitemap, skip pages whose lastmod is not after DATE (e.g. 2024-05-01)")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="with --sitemap and --result-store, skip pages whose lastmod is not after their "
+                             "last stored audit")
+    parser.add_argument("--source", metavar="PATH",
+                        help="audit saved pages instead of fetching them: a WARC file (.warc or .warc.gz), a "
+                             "directory of WARC files, a directory of HTML files laid out like a wget mirror, or "
+                             "one HTML file (with --base-url). "
+                             "Without a CSV, every page in it is audited with the checks that need no keywords")
+    parser.add_argument("--base-url",
+                        help="with --source and a flat directory of HTML files, the URL the file names are "
+                             "relative to (default: the first directory level is the host); with a single HTML "
+                             "file, that page's URL")
+    parser.add_argument("--http-cache", default=HTTP_CACHE_PATH,
+                        help="SQLite file for ETag/Last-Modified revalidation")
+    parser.add_argument("--result-store", default=RESULT_STORE_PATH,
+                        help="SQLite file of previous results; unchanged pages are not re-analyzed")
+    parser.add_argument("--link-report",
+                        help="write inbound links, orphans, click depth and broken pages (CSV) for the URLs crawled "
+                             "in this run")
+    parser.add_argument("--follow-depth", type=int, default=0,
+                        help="with --link-report, also follow internal links this many clicks out (default: 0)")
+    parser.add_argument("--max-pages", type=int, default=10_000,
+                        help="with --follow-depth, stop following after this many crawled pages (default: 10000)")
+    parser.add_argument("--metrics-json",
+                        help="write per-stage timings and counters as JSON here at the end of the run")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+    try:
+        rules = enabled_rules(args.profile, args.disable_rule)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if not args.csv and not args.sitemap and not args.source:
+        parser.error("give a keywords CSV, --sitemap or --source")
+    if args.source and args.sitemap:
+        parser.error("--source and --sitemap can't be combined")
+    if args.source and not os.path.exists(args.source):
+        parser.error(f"--source: no such file or directory: {args.source}")
+    since = parse_lastmod(args.since)
+    if args.since and since is None:
+        parser.error(f"--since: not a date: {args.since!r}")
+    if args.changed_only and not args.result_store:
+        parser.error("--changed-only needs --result-store (or RESULT_STORE_PATH)")
+    source = None
+    if args.source:
+        try:
+            source = open_page_source(args.source, args.base_url)
+        except ValueError as exc:
+            parser.error(f"--source: {exc}")
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    if args.metrics_json or args.metrics_port:
+        INSTRUMENTS.enabled = True
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", args.metrics_port)
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "jsonl")
+    jsonl_path = args.output if fmt == "jsonl" else args.output + ".jsonl.part"
+    checkpoint_path = args.checkpoint or args.output + ".done"
+
+    if args.no_resume:
+        for path in (jsonl_path, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+    _trim_partial_line(jsonl_path)
+    done = _load_checkpoint(checkpoint_path)
+    _drop_unfinished(jsonl_path, done)
+    if done:
+        logger.info("Resuming: %d URL(s) already completed", len(done))
+
+    if args.source:
+        crawler = source
+    else:
+        crawler = Crawler(
+            max_workers=args.workers,
+            per_host=args.per_host,
+            http=HttpClient(pool_size=args.workers, cache_path=args.http_cache),
+            scheduler=HostScheduler(rate=args.rate, burst=max(1, int(args.rate))),
+        )
+    keywords_dict: dict[str, dict[str, any]] = {}
+    result_store = ResultStore(args.result_store) if args.result_store else None
+
+    def _todo() -> Iterator[str]:
+        if args.source and not args.csv:
+            for url in crawler.urls():
+                if url not in done:
+                    keywords_dict[url] = {}
+                    yield url
             return
+        if not args.sitemap:
+            for url, primary, secondaries in iter_keyword_groups(args.csv):
+                if url in done:
+                    continue
+                keywords_dict[url] = {"primary_kw": primary, "secondary_kw": secondaries}
+                yield url
+            return
+        known = parse_keywords_csv(args.csv) if args.csv else {}
+        pages = iter_sitemap_pages(args.sitemap, crawler.http, crawler.scheduler)
+        skipped = 0
+        for url, lastmod, info in join_keywords(pages, known):
+            if url in done:
+                continue
+            audited_at = result_store.audited_at(url) if args.changed_only else None
+            if not sitemap_page_changed(lastmod, since, audited_at):
+                skipped += 1
+                continue
+            keywords_dict[url] = info
+            yield url
+        if skipped:
+            logger.info("Skipped %d sitemap page(s) not modified according to their lastmod", skipped)
+
+    counts = {"ok": 0, "error": 0}
+    link_graph = LinkGraph() if args.link_report else None
+    # the keyword rules are the only LLM users, and only CSV pages have
+    # keywords: local profiles and keyword-free runs need no OPENAI_API_KEY
+    needs_llm = bool(args.csv) and any(r.cost == "llm" for r in rules)
+    client = get_openai_client() if needs_llm else None
+    results = iter_page_metrics(_todo(), keywords_dict, client, crawler=crawler,
+                                matcher=get_keyword_matcher(args.matcher),
+                                result_store=result_store,
+                                processes=args.processes, rules=rules,
+                                link_graph=link_graph)
+    with open(jsonl_path, "a", encoding="utf-8") as out, open(checkpoint_path, "a", encoding="utf-8") as ckpt:
+        for url, metrics in results:
+            info = keywords_dict.pop(url, {})
+            record = {
+                "url": url,
+                "primary_kw": info.get("primary_kw", ""),
+                "secondary_kw": info.get("secondary_kw", []),
+                "metrics": metrics,
+            }
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            if _audit_failed(metrics):
+                counts["error"] += 1
+            else:
+                # the URL only counts as done once its result is on disk
+                ckpt.write(url + "\n")
+                ckpt.flush()
+                counts["ok"] += 1
+            logger.info("Audited %s (%d done, %d failed)", url, counts["ok"], counts["error"])
+
+    if fmt == "parquet":
+        _jsonl_to_parquet(jsonl_path, args.output)
+    if link_graph is not None:
+        if args.follow_depth:
+            expand_link_graph(link_graph, crawler, args.follow_depth, args.max_pages)
+        _write_link_report(link_graph, args.link_report)
+        logger.info("Link graph: %d pages, %d links, %d broken, report in %s",
+                    link_graph.crawled_count, link_graph.edge_count, link_graph.broken_count, args.link_report)
+    if args.source:
+        crawler.close()
+    for host, stats in INSTRUMENTS.host_stats().items():
+        if stats["throttle_events"]:
+            logger.info("Host %s: %d request(s), throttled %d time(s), %.1fs backoff, %.1fs waited",
+                        host, stats["requests"], stats["throttle_events"], stats["backoff_s"], stats["waited_s"])
+    if args.metrics_json:
+        with open(args.metrics_json, "w", encoding="utf-8") as fh:
+            json.dump(INSTRUMENTS.summary(), fh, indent=2)
+    logger.info("Finished: %d audited, %d failed, results in %s", counts["ok"], counts["error"], args.output)
+    return 0
 
-        # Now, for each metric whose recommendation != "/", call OpenAI to get a conversational tip.
-        st.subheader("💬 Smart Fix Suggestions (Examples Stay On‐Topic)")
-        any_issue = False
-
-        for metric, data in single_result.items():
-            if metric == "_lang":
-                continue  # skip language code
-
-            raw_rec = data.get("recommendation", "")
-            example = data.get("example", "")  # this is the current text, e.g. current meta title/description
-
-            if raw_rec and raw_rec != "/":
-                any_issue = True
-                st.markdown(f"**{metric}:** {raw_rec}")
-                if example:
-                    st.markdown(f"_Current content:_ “{example}”")
-                else:
-                    st.markdown("_Current content: (none found)_")
-                print("Example: ")
-                print(example)
-
-                if "Primary KW" in metric:
-                    kw_list = [primary_kw] if primary_kw else None
-                elif "Secondary KWs" in metric:
-                    kw_list = secondary_kws if secondary_kws else None
-                else:
-                    kw_list = None
-
-                # Fetch a conversational tip, passing along the actual current example
-                with st.spinner(f"Generating tip for '{metric}'…"):
-                    tip = get_conversational_tip(client, metric, raw_rec, example, kw_list)
-                st.markdown(f"> {tip}")
-                st.markdown("---")
-
-        if not any_issue:
-            st.success("🎉 No actionable issues found! Your page meets the main SEO criteria we checked.")
 
 if __name__ == "__main__":
-    main()
+    # `streamlit run ContentAgent.py` starts the app; `python ContentAgent.py
+    # keywords.csv -o results.jsonl` runs a headless batch audit.
+    if st.runtime.exists():
+        main()
+    else:
+        sys.exit(run_cli())
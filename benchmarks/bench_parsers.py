@@ -0,0 +1,88 @@
+"""Compare HTML parser backends on a corpus of saved pages.
+
+    python benchmarks/bench_parsers.py [corpus_dir] [--repeat N]
+
+For every available backend this times clean_html() (parse + strip page chrome)
+and PageIndex construction, and checks that each backend indexes every page
+exactly like the default html.parser backend does.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ContentAgent import PARSER_BACKENDS, PageIndex, clean_html  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def _available(backend: str) -> bool:
+    try:
+        clean_html("<html></html>", backend)
+        return True
+    except ImportError:
+        return False
+
+
+def _snapshot(index: PageIndex) -> tuple:
+    return (
+        index.lang, index.title, index.meta_description, index.outline, index.paragraphs,
+        index.list_count, index.bold, index.images, index.links, index.full_text,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the corpus (default: 5)")
+    args = parser.parse_args(argv)
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(args.corpus, "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            pages[os.path.basename(path)] = fh.read()
+    if not pages:
+        print(f"No .html files in {args.corpus}")
+        return 1
+    total_mb = sum(len(html.encode("utf-8")) for html in pages.values()) / 1e6
+
+    reference = {name: _snapshot(PageIndex(clean_html(html, "html.parser"))) for name, html in pages.items()}
+
+    print(f"{len(pages)} pages, {total_mb:.2f} MB, {args.repeat} passes\n")
+    print(f"{'backend':<12} {'parse ms/page':>14} {'index ms/page':>14} {'pages/s':>9} {'MB/s':>7} {'speedup':>8}  matches")
+    baseline = None
+    for backend in PARSER_BACKENDS:
+        if not _available(backend):
+            print(f"{backend:<12} (not installed)")
+            continue
+        parse_s = index_s = 0.0
+        mismatched = []
+        for rep in range(args.repeat):
+            for name, html in pages.items():
+                t0 = time.perf_counter()
+                doc = clean_html(html, backend)
+                t1 = time.perf_counter()
+                index = PageIndex(doc)
+                index.full_text  # lazily computed; include it in the timing
+                t2 = time.perf_counter()
+                parse_s += t1 - t0
+                index_s += t2 - t1
+                if rep == 0 and _snapshot(index) != reference[name]:
+                    mismatched.append(name)
+
+        runs = len(pages) * args.repeat
+        total_s = parse_s + index_s
+        baseline = baseline or total_s
+        print(
+            f"{backend:<12} {parse_s / runs * 1000:>14.2f} {index_s / runs * 1000:>14.2f} "
+            f"{runs / total_s:>9.1f} {total_mb * args.repeat / total_s:>7.2f} {baseline / total_s:>7.1f}x  "
+            + ("all" if not mismatched else "differs on " + ", ".join(mismatched))
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""End-to-end throughput benchmark against an offline corpus and a stub LLM.
+
+    python benchmarks/bench_pipeline.py [corpus_dir] [--pages N] [--latency MS] [--offline] [--json PATH]
+
+The corpus pages are served by a local HTTP server (each page under several
+URLs, to reach --pages), and keyword matching goes to a deterministic stub
+OpenAI client that sleeps --latency ms per call. Caches are disabled, so
+every run does the same work. Reports:
+
+  * parse:    clean_html() + PageIndex CPU time per page, offline
+  * rules:    CPU time per page of every enabled local rule, offline
+  * fetch:    extract_main_content() over HTTP, sequential, pages/s
+  * pipeline: iter_page_metrics() over all URLs, pages/s and LLM calls;
+              with --offline the pages come from an in-memory PageSource
+              instead of the server, so only CPU and the stub LLM count
+
+plus the process's peak RSS at the end. --json writes the same numbers as a
+machine-readable summary, for comparing runs before a deploy.
+"""
+import argparse
+import glob
+import http.server
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import zlib
+
+# every run must do the same work: no LLM, HTTP-validator or result caches
+os.environ["LLM_CACHE_PATH"] = ""
+os.environ.pop("HTTP_CACHE_PATH", None)
+os.environ.pop("RESULT_STORE_PATH", None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ContentAgent as CA  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+JSON_SHAPE_START = "in this shape: "
+JSON_SHAPE_END = " using true or false"
+
+
+class StubOpenAI:
+    # Just enough of openai.Client for the pipeline: chat.completions.create().
+    # Answers are derived from a hash of the prompt, so runs are repeatable.
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.json_calls = 0
+        self._lock = threading.Lock()
+        self.chat = self
+        self.completions = self
+
+    def create(self, model: str, messages: list[dict[str, str]], response_format=None, stream: bool = False, **_):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.calls += 1
+            self.json_calls += response_format is not None
+        if self.latency:
+            time.sleep(self.latency)
+        if response_format is not None and JSON_SHAPE_START in prompt:
+            # the batched keyword prompt spells out the expected reply shape
+            shape = json.loads(prompt.split(JSON_SHAPE_START, 1)[1].split(JSON_SHAPE_END, 1)[0])
+            answer = json.dumps({
+                group: {key: zlib.crc32(f"{group}:{key}".encode()) % 3 != 0 for key in entries}
+                for group, entries in shape.items()
+            })
+        else:
+            answer = "yes" if zlib.crc32(prompt.encode()) % 2 else "no"
+        message = type("Message", (), {"content": answer})()
+        return type("Completion", (), {"choices": [type("Choice", (), {"message": message})()]})()
+
+
+class _CorpusHandler(http.server.BaseHTTPRequestHandler):
+    # /<copy>/<name>.html -> corpus page <name>.html, for any <copy>
+    pages: dict[str, bytes] = {}
+
+    def do_GET(self):
+        body = self.pages.get(self.path.rsplit("/", 1)[-1])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _CorpusSource(CA.PageSource):
+    # the same URL -> page mapping as the server, without the network
+    def __init__(self, pages: dict[str, bytes], base: str):
+        self.pages = pages
+        self.base = base
+
+    def urls(self) -> CA.Iterator[str]:
+        return iter(f"{self.base}/{name}" for name in self.pages)
+
+    def body(self, url: str) -> tuple[bytes, str] | None:
+        body = self.pages.get(url.rsplit("/", 1)[-1]) if url.startswith(self.base) else None
+        return (body, "text/html; charset=utf-8") if body is not None else None
+
+
+def serve_corpus(pages: dict[str, bytes]) -> tuple[http.server.ThreadingHTTPServer, str]:
+    handler = type("Handler", (_CorpusHandler,), {"pages": pages})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, KiB elsewhere
+
+
+def _keywords(name: str) -> dict[str, any]:
+    # one primary and two secondaries taken from the file name, e.g. blog_en_small
+    words = os.path.splitext(name)[0].split("_")
+    return {"primary_kw": words[0], "secondary_kw": words[1:3]}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=200, help="URLs to audit in the pipeline run (default: 200)")
+    parser.add_argument("--latency", type=float, default=50, help="stub LLM latency per call in ms (default: 50)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent fetches (default: 8)")
+    parser.add_argument("--processes", type=int, default=0, help="analysis worker processes (default: 0)")
+    parser.add_argument("--profile", choices=sorted(CA.RULE_PROFILES), default="full", help="rule profile")
+    parser.add_argument("--matcher", choices=["llm", "local"], default="llm", help="keyword matcher backend")
+    parser.add_argument("--offline", action="store_true",
+                        help="pipeline reads pages from memory through a PageSource, not over HTTP")
+    parser.add_argument("--json", help="also write the summary as JSON to this file")
+    args = parser.parse_args(argv)
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(args.corpus, "*.html"))):
+        with open(path, "rb") as fh:
+            pages[os.path.basename(path)] = fh.read()
+    if not pages:
+        print(f"No .html files in {args.corpus}")
+        return 1
+    names = sorted(pages)
+    rules = CA.enabled_rules(args.profile, disabled=())
+    summary: dict[str, any] = {
+        "corpus_pages": len(pages), "pages": args.pages, "latency_ms": args.latency,
+        "workers": args.workers, "processes": args.processes, "profile": args.profile,
+        "matcher": args.matcher, "parser": CA.PARSER_BACKEND, "offline": args.offline,
+    }
+    print(f"{len(pages)} corpus pages, {args.pages} URLs, stub LLM {args.latency:.0f} ms/call, "
+          f"parser {CA.PARSER_BACKEND}, profile {args.profile}\n")
+
+    # parse + per-rule CPU, offline (no server, no LLM)
+    indexes = {}
+    t0 = time.process_time()
+    for name in names:
+        indexes[name] = CA.PageIndex(CA.clean_html(pages[name].decode("utf-8", "replace")),
+                                     CA.rule_index_tags(rules))
+        indexes[name].full_text
+    parse_ms = (time.process_time() - t0) / len(names) * 1000
+    summary["parse_cpu_ms_per_page"] = round(parse_ms, 3)
+    print(f"{'parse (clean_html + PageIndex)':<34} {parse_ms:>9.2f} ms/page")
+
+    summary["rule_cpu_ms_per_page"] = {}
+    for r in rules:
+        if r.cost == "llm":
+            continue
+        t0 = time.process_time()
+        for name in names:
+            r.check(CA.RuleContext(f"https://example.com/{name}", indexes[name], _keywords(name)))
+        rule_ms = (time.process_time() - t0) / len(names) * 1000
+        summary["rule_cpu_ms_per_page"][r.name] = round(rule_ms, 3)
+        print(f"  {r.name:<32} {rule_ms:>9.3f} ms/page")
+    del indexes
+
+    server, base = serve_corpus(pages)
+    try:
+        urls = [f"{base}/{i}/{names[i % len(names)]}" for i in range(args.pages)]
+        keywords = {url: _keywords(url.rsplit("/", 1)[-1]) for url in urls}
+
+        # sequential fetch + parse through the HTTP layer
+        session = CA.HttpClient(pool_size=1, cache_path=None)
+        sample = urls[:min(len(urls), len(names) * 4)]
+        t0 = time.perf_counter()
+        for url in sample:
+            CA.extract_main_content(url, session=session)
+        fetch_rate = len(sample) / (time.perf_counter() - t0)
+        summary["fetch_pages_per_s"] = round(fetch_rate, 2)
+        print(f"\n{'fetch (extract_main_content)':<34} {fetch_rate:>9.1f} pages/s")
+
+        # the full pipeline, as the batch CLI runs it
+        client = StubOpenAI(latency=args.latency / 1000)
+        if args.offline:
+            crawler = _CorpusSource(pages, base)
+        else:
+            crawler = CA.Crawler(
+                max_workers=args.workers,
+                per_host=args.workers,  # every URL is on 127.0.0.1
+                http=CA.HttpClient(pool_size=args.workers, cache_path=None),
+                scheduler=CA.HostScheduler(rate=1e6, burst=args.workers),
+            )
+        done = errors = 0
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        for url, metrics in CA.iter_page_metrics(urls, keywords, client, crawler=crawler,
+                                                 matcher=CA.get_keyword_matcher(args.matcher),
+                                                 processes=args.processes, rules=rules):
+            done += 1
+            errors += "error" in metrics
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+    finally:
+        server.shutdown()
+
+    summary.update({
+        "pipeline_pages_per_s": round(done / wall, 2),
+        "pipeline_wall_s": round(wall, 3),
+        "pipeline_cpu_s": round(cpu, 3),
+        "errors": errors,
+        "llm_calls": client.calls,
+        "llm_json_calls": client.json_calls,
+        "llm_calls_per_page": round(client.calls / max(done, 1), 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    })
+    print(f"{'pipeline (iter_page_metrics)':<34} {done / wall:>9.1f} pages/s  "
+          f"({done} pages, {errors} errors, {wall:.2f}s wall, {cpu:.2f}s CPU)")
+    print(f"{'LLM calls':<34} {client.calls:>9d}  ({client.json_calls} batched, "
+          f"{client.calls / max(done, 1):.2f} per page)")
+    print(f"{'peak RSS':<34} {summary['peak_rss_mb']:>9.1f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())